@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""Usage:
+  bench_discovery.py [--repos=<n> --dirs=<n> --workers=<n> --work-dir=<dir>]
+  bench_discovery.py (-h|--help)
+
+Time LocalRepoIndex.refresh() on a made-up clone_dir of about <dirs> directories: <repos>
+repos, a big data directory, a virtualenv and a node_modules. Reports a first (cold) scan
+on one thread and on <n> threads, and a scan with the saved index.
+
+Options:
+  -h --help             show this screen.
+  --repos=<n>           number of repos [default: 200]
+  --dirs=<n>            number of directories in all [default: 50000]
+  --workers=<n>         LocalRepoIndex workers [default: 8]
+  --work-dir=<dir>      make the tree in <dir> [default: ~/.cache/githubtools-bench/discovery]
+"""
+import os
+import sys
+import time
+from os import path
+from docopt import docopt
+
+import pygit2
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+from githubtools import LocalRepoIndex
+
+
+def make_tree(clone_dir, n_repos, n_dirs):
+    """clone_dir/projects/group-NN/repo-NNNN (repos), and data/, venv/ and node_modules/
+    trees splitting the rest of the directories 3:1:1. Made once."""
+    if path.exists(path.join(clone_dir, 'done')):
+        return
+    for n in range(n_repos):
+        pygit2.init_repository(path.join(clone_dir, 'projects', f"group-{n // 20:02}", f"repo-{n:04}"))
+    rest = n_dirs - n_repos
+    for name, count in (('data', rest * 3 // 5), ('venv', rest // 5), ('node_modules', rest // 5)):
+        for n in range(count): # 3 levels, about count**(1/3) wide
+            width = max(1, round(count ** (1 / 3)))
+            os.makedirs(path.join(clone_dir, name, f"d{n // width ** 2}", f"d{n // width % width}", f"d{n % width}"),
+                        exist_ok=True)
+    open(path.join(clone_dir, 'done'), 'w').close()
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__)
+    work_dir = path.expanduser(arguments['--work-dir'])
+    clone_dir = path.join(work_dir, 'tree')
+    make_tree(clone_dir, int(arguments['--repos']), int(arguments['--dirs']))
+    index_file = path.join(work_dir, 'git_list')
+    workers = int(arguments['--workers'])
+
+    def refresh(workers, cold):
+        if cold and path.exists(index_file):
+            os.remove(index_file)
+        index = LocalRepoIndex(clone_dir, index_file, workers=workers)
+        index.refresh()
+        index.save()
+        return index
+
+    for name, args in (('refresh, cold, 1 thread', (1, True)),
+                       (f'refresh, cold, {workers} threads', (workers, True)),
+                       ('refresh, indexed', (workers, False))):
+        seconds, index = timed(refresh, *args)
+        print(f"{name:<26} {seconds:>8.2f}s {len(index):>6} repos {len(index.dirs):>7} dirs listed")
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""Usage:
+  bench_forker.py [(-v|--verbose) --sizes=<list> --latency=<sec> --fork-delay=<sec> --jobs=<n>]
+                  [--work-dir=<dir> --json --sequential]
+  bench_forker.py (-h|--help)
+
+Run the whole forker.py flow (search, fork, clone, add upstream) against a local stand-in
+for the Github API, once for each number of repos in <list>, and report wall time, API
+calls per repo and the peak RSS of the forker.py process.
+
+Options:
+  -h --help             show this screen.
+  -v --verbose          also show the calls made to each endpoint
+  --sizes=<list>        comma-separated numbers of repos [default: 10,100,1000]
+  --latency=<sec>       delay each API response by <sec> seconds [default: 0.05]
+  --fork-delay=<sec>    forks are ready <sec> seconds after they're created [default: 1]
+  --jobs=<n>            forker.py --jobs [default: 4]
+  --work-dir=<dir>      keep fixture repos and clones in <dir> [default: ~/.cache/githubtools-bench]
+  --json                print the results as JSON lines
+  --sequential          run forker.py with --sequential
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import subprocess
+from os import path
+from docopt import docopt
+
+from fakegithub import FakeGithub
+
+FORKER = path.join(path.dirname(path.dirname(path.abspath(__file__))), 'forker.py')
+
+
+def run_forker(server, n_repos, clone_dir, jobs=4, sequential=False):
+    """run forker.py for n_repos; returns (seconds, peak RSS in bytes, exit status)"""
+    command = [sys.executable, FORKER, '--fork', '--clone', '--upstream', '--no-cache',
+               '-t', 'bench', f'--api-url={server.url}', f'--dir={clone_dir}',
+               f'--locals={path.join(clone_dir, "git_list")}', f'--jobs={jobs}', f'-n{n_repos}', 'project']
+    if sequential:
+        command.append('--sequential')
+    start = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    _, status, usage = os.wait4(process.pid, 0)
+    seconds = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return seconds, usage.ru_maxrss * 1024, process.returncode # ru_maxrss is in KiB on Linux
+
+
+def bench(n_repos, work_dir, latency, fork_delay, jobs, sequential=False):
+    server = FakeGithub(path.join(work_dir, 'fixtures'), n_repos, latency=latency, fork_delay=fork_delay)
+    server.start()
+    clone_dir = path.join(work_dir, f"clones-{n_repos}")
+    shutil.rmtree(clone_dir, ignore_errors=True)
+    os.makedirs(clone_dir)
+    try:
+        seconds, peak_rss, status = run_forker(server, n_repos, clone_dir, jobs, sequential)
+    finally:
+        server.stop()
+    cloned = sum(1 for entry in os.scandir(clone_dir) if entry.is_dir())
+    calls = sum(server.calls.values())
+    return {'repos': n_repos, 'cloned': cloned, 'seconds': round(seconds, 3),
+            'api_calls': calls, 'calls_per_repo': round(calls / n_repos, 2),
+            'peak_rss_mb': round(peak_rss / 2**20, 1), 'status': status,
+            'calls': dict(server.calls)}
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__)
+    work_dir = path.expanduser(arguments['--work-dir'])
+    sizes = [int(size) for size in arguments['--sizes'].split(',')]
+    if not arguments['--json']:
+        print(f"{'repos':>6} {'cloned':>6} {'seconds':>8} {'calls':>6} {'calls/repo':>10} {'peak RSS MB':>11}")
+    for n_repos in sizes:
+        result = bench(n_repos, work_dir, float(arguments['--latency']), float(arguments['--fork-delay']),
+                       int(arguments['--jobs']), arguments['--sequential'])
+        if arguments['--json']:
+            print(json.dumps(result))
+            continue
+        print(f"{result['repos']:>6} {result['cloned']:>6} {result['seconds']:>8.2f} {result['api_calls']:>6}"
+              f" {result['calls_per_repo']:>10.2f} {result['peak_rss_mb']:>11.1f}"
+              + (f"  forker.py exited with {result['status']}" if result['status'] else ''))
+        if arguments['--verbose']:
+            for route, count in sorted(result['calls'].items()):
+                print(f"{'':>8}{count:>6}  {route}")
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""Usage:
+  bench_ratelimit.py [(-v|--verbose) --repos=<n> --per-page=<n> --tokens=<n> --rate-limit=<n>]
+                     [--window=<sec> --secondary-every=<n> --retry-after=<sec> --work-dir=<dir>]
+  bench_ratelimit.py (-h|--help)
+
+Page through a search against a local stand-in for the Github API that rate limits each
+token to <n> requests per <sec> seconds and answers every so many requests with a 429
+secondary rate limit. Runs it with one token, with a pool of <tokens> tokens, with the
+pool again getting Retry-After as an HTTP date, and with the first token's limit used up
+before the search starts (so its first request is a 403), and reports for each run the repos found,
+wall time, retries, seconds waited and the requests made with each token. Every run should
+find every repo; the pool should wait less for the per-token limit than one token does.
+
+Options:
+  -h --help             show this screen.
+  -v --verbose          verbose Githubtool (shows each rate-limited response)
+  --repos=<n>           matching repos [default: 300]
+  --per-page=<n>        search results per page [default: 10]
+  --tokens=<n>          tokens in the pool [default: 3]
+  --rate-limit=<n>      requests per token and resource in each window [default: 10]
+  --window=<sec>        rate limit window [default: 2]
+  --secondary-every=<n>
+                        answer every <n>th request with a 429 [default: 7]
+  --retry-after=<sec>   Retry-After of those 429s [default: 1]
+  --work-dir=<dir>      keep fixture repos in <dir> [default: ~/.cache/githubtools-bench]
+"""
+import sys
+import time
+from os import path
+from docopt import docopt
+
+from fakegithub import FakeGithub
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+from githubtools import Githubtool
+
+
+def bench(arguments, tokens, retry_after_date=False, exhausted=()):
+    server = FakeGithub(path.join(path.expanduser(arguments['--work-dir']), 'fixtures'), int(arguments['--repos']),
+                        per_page_max=int(arguments['--per-page']),
+                        rate_limit=int(arguments['--rate-limit']),
+                        rate_limit_window=float(arguments['--window']),
+                        secondary_every=int(arguments['--secondary-every']),
+                        retry_after=int(arguments['--retry-after']),
+                        retry_after_date=retry_after_date)
+    server.start()
+    for token in exhausted:
+        server.exhaust(token, 'search')
+    ght = Githubtool(arguments['--verbose'], access_token=','.join(tokens), base_url=server.url)
+    try:
+        start = time.perf_counter()
+        found = sum(1 for _ in ght.iter_github_repos('project'))
+        seconds = time.perf_counter() - start
+    finally:
+        server.stop()
+    limited = {status: sum(count for route, count in server.calls.items() if route.endswith(f"({status})"))
+               for status in (403, 429)}
+    return found, seconds, ght.scheduler, limited, [server.token_calls[token] for token in tokens]
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__)
+    pool = [f"bench{n}" for n in range(int(arguments['--tokens']))]
+    print(f"{'run':<24} {'found':>5} {'seconds':>8} {'retries':>7} {'waited':>7} {'403s':>5} {'429s':>5}  requests per token")
+    failed = False
+    for name, tokens, options in (('1 token', pool[:1], {}),
+                                  (f'{len(pool)} tokens', pool, {}),
+                                  (f'{len(pool)} tokens, HTTP date', pool, {'retry_after_date': True}),
+                                  (f'{len(pool)} tokens, 1 used up', pool, {'exhausted': pool[:1]})):
+        found, seconds, scheduler, limited, token_calls = bench(arguments, tokens, **options)
+        failed = failed or found != int(arguments['--repos'])
+        print(f"{name:<24} {found:>5} {seconds:>8.2f} {scheduler.retries:>7} {scheduler.waited:>7.1f}"
+              f" {limited[403]:>5} {limited[429]:>5}  {' '.join(str(calls) for calls in token_calls)}")
+    sys.exit(1 if failed else 0)
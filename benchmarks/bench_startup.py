@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+"""Usage:
+  bench_startup.py [--runs=<n>]
+  bench_startup.py (-h|--help)
+
+Time how long the command line tools take to start, as the median of <n> runs of each.
+"githubtools sync" is run on an empty directory, so it's all startup and no work.
+
+Options:
+  -h --help             show this screen.
+  --runs=<n>            run each command <n> times [default: 10]
+"""
+import sys
+import time
+import tempfile
+import statistics
+import subprocess
+from os import path
+from docopt import docopt
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+
+
+def commands(empty_dir):
+    python = sys.executable
+    return [
+        ('import githubtools', [python, '-c', 'import githubtools']),
+        ('githubtools --help', [python, path.join(ROOT, 'githubtools_cli.py'), '--help']),
+        ('githubtools sync DIR', [python, path.join(ROOT, 'githubtools_cli.py'), 'sync', empty_dir,
+                                  f'--locals={path.join(empty_dir, "git_list")}']),
+        ('forker.py --help', [python, path.join(ROOT, 'forker.py'), '--help']),
+        ('fixorigin.py --help', [python, path.join(ROOT, 'fixorigin.py'), '--help']),
+    ]
+
+
+def time_command(command, runs):
+    """median and fastest seconds of runs of command"""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=ROOT, stdout=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), min(times)
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__)
+    runs = int(arguments['--runs'])
+    with tempfile.TemporaryDirectory() as empty_dir:
+        print(f"{'command':<24} {'median ms':>10} {'min ms':>8}")
+        for name, command in commands(empty_dir):
+            median, fastest = time_command(command, runs)
+            print(f"{name:<24} {1000 * median:>10.1f} {1000 * fastest:>8.1f}")
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""Usage:
+  bench_watch.py [(-v|--verbose) --repos=<n> --polls=<n> --interval=<sec>]
+                 [--new=<list> --fork --work-dir=<dir>]
+  bench_watch.py (-h|--help)
+
+Run Githubtool.watch() against a local stand-in for the Github API, adding new matching
+repos before some of the polls, and report for each poll the repos it found and the
+search requests it cost, telling apart those answered 304 Not Modified (which don't
+count against Github's rate limit).
+
+Options:
+  -h --help             show this screen.
+  -v --verbose          verbose Githubtool
+  --repos=<n>           matching repos before watching starts [default: 300]
+  --polls=<n>           number of polls [default: 12]
+  --interval=<sec>      seconds between polls [default: 0.05]
+  --new=<list>          comma-separated poll:count, add count repos before poll [default: 4:3,9:1]
+  --fork                fork the new repos too
+  --work-dir=<dir>      keep fixture repos and state in <dir> [default: ~/.cache/githubtools-bench]
+"""
+import os
+import sys
+import time
+import shutil
+from os import path
+from docopt import docopt
+
+from fakegithub import FakeGithub
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+from githubtools import Githubtool
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__)
+    work_dir = path.join(path.expanduser(arguments['--work-dir']), 'watch')
+    shutil.rmtree(work_dir, ignore_errors=True)
+    os.makedirs(work_dir)
+    new = dict(tuple(int(n) for n in item.split(':')) for item in arguments['--new'].split(','))
+    server = FakeGithub(path.join(path.dirname(work_dir), 'fixtures'), int(arguments['--repos']),
+                        fork_delay=0)
+    server.start()
+    ght = Githubtool(arguments['--verbose'], clone_dir=work_dir, locals_file=path.join(work_dir, 'git_list'),
+                     access_token='bench', base_url=server.url, cache_dir=path.join(work_dir, 'cache'))
+    polls = int(arguments['--polls'])
+    print(f"{'poll':>4} {'added':>5} {'found':>5} {'searches':>8} {'304s':>5} {'other calls':>11} {'seconds':>8}")
+    try:
+        for poll in range(polls):
+            # one poll per watch() so that repos can be added in between; the state file carries over
+            if new.get(poll):
+                server.add_repos(new[poll])
+            server.reset()
+            start = time.perf_counter()
+            items = list(ght.watch('project', interval=0, polls=1, state_file=path.join(work_dir, 'state'),
+                                   fork=arguments['--fork'], clone=False, upstream=False))
+            seconds = time.perf_counter() - start
+            searches = server.calls['GET /search/repositories']
+            not_modified = server.calls['GET /search/repositories (304)']
+            other = sum(server.calls.values()) - searches - not_modified
+            print(f"{poll:>4} {new.get(poll, 0):>5} {len(items):>5} {searches:>8} {not_modified:>5} {other:>11} {seconds:>8.3f}")
+            time.sleep(float(arguments['--interval']))
+    finally:
+        server.stop()
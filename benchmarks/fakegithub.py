@@ -0,0 +1,372 @@
+"""A local stand-in for the parts of the Github API that Githubtool uses, for benchmarks.
+
+    server = FakeGithub(fixture_dir, n_repos=100, latency=0.05)
+    server.start()
+    ght = Githubtool(base_url=server.url, access_token='bench', ...)
+    ...
+    print(server.calls)
+    server.stop()
+
+Serves, for n_repos upstream repos bench-org/project-NNNN:
+  GET  /search/repositories      every repo matches, paginated like Github; created: and
+                                 pushed: date ranges (and >, >=, <, <= dates) are obeyed,
+                                 and only the first search_cap results can be paged to
+  GET  /user, /repos/:owner/:repo, /repos/:owner/:repo/branches/:branch
+  POST /repos/:owner/:repo/forks  forks are ready fork_delay seconds later
+  POST /graphql                  the viewer's forks, and repository(owner:, name:) lookups
+Each response is delayed by latency seconds, and GETs are answered 304 Not Modified
+when If-None-Match has their ETag; those are also counted as 'GET /route (304)'.
+Repos are cloned from bare repos made once under fixture_dir; a fork is cloned from
+its upstream's bare repo. add_repos() makes more upstream repos, created after the rest.
+
+Rate limits are off unless asked for. With rate_limit, each access token may make that many
+requests of each resource (core, search, graphql) per rate_limit_window seconds, after which
+it gets 403s with X-RateLimit-Remaining: 0 until the window resets. With secondary_every,
+every so many requests get a 429 secondary rate limit with a Retry-After of retry_after
+seconds, sent as an HTTP date with retry_after_date. Those are counted as 'GET /route (403)'
+and 'GET /route (429)', and token_calls counts the requests made with each token.
+exhaust() uses up a token's limit behind the client's back.
+"""
+import re
+import json
+import time
+import calendar
+import math
+import shutil
+import hashlib
+import threading
+from os import path
+from collections import Counter
+from email.utils import formatdate
+from urllib.parse import urlsplit, parse_qs, urlencode
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pygit2
+
+
+USER = 'benchuser'
+ORG = 'bench-org'
+# web and clone urls; like github.com they're on another host than the API, and are never fetched
+WEB_URL = 'https://github.example'
+# repo n was created CREATED_START + n * CREATED_STEP, and pushed to a day later
+CREATED_START = calendar.timegm((2015, 1, 1, 0, 0, 0))
+CREATED_STEP = 3600
+
+
+def make_fixtures(fixture_dir, n_repos, commits=5, files=20):
+    """bare repos fixture_dir/bench-org/project-NNNN.git, copied from one template.
+    Existing ones are kept, so fixtures are only made once per size."""
+    template = path.join(fixture_dir, 'template.git')
+    if not path.exists(template):
+        repo = pygit2.init_repository(template, bare=True)
+        signature = pygit2.Signature('Bench', 'bench@example.com', 0, 0)
+        parents = []
+        for commit in range(commits):
+            builder = repo.TreeBuilder()
+            for n in range(files):
+                blob = repo.create_blob(f"file {n}, commit {commit}\n".encode() * 50)
+                builder.insert(f"file{n:02}.txt", blob, pygit2.GIT_FILEMODE_BLOB)
+            oid = repo.create_commit('refs/heads/main', signature, signature,
+                                     f"commit {commit}", builder.write(), parents)
+            parents = [oid]
+        repo.set_head('refs/heads/main')
+    for n in range(n_repos):
+        repo_path = path.join(fixture_dir, ORG, f"{repo_name(n)}.git")
+        if not path.exists(repo_path):
+            shutil.copytree(template, repo_path)
+
+
+def parse_time(timestamp):
+    """epoch seconds for a search qualifier's 2020-01-01T00:00:00Z"""
+    return calendar.timegm(time.strptime(timestamp, '%Y-%m-%dT%H:%M:%SZ'))
+
+
+def repo_name(n):
+    return f"project-{n:04}"
+
+
+class FakeGithub:
+    """Github API stand-in on a local port, with a count of the calls made to each endpoint"""
+    def __init__(self, fixture_dir, n_repos, latency=0.0, fork_delay=1.0, per_page_max=100, search_cap=1000,
+                 rate_limit=None, rate_limit_window=60.0, secondary_every=None, retry_after=1,
+                 retry_after_date=False):
+        self.fixture_dir = path.abspath(fixture_dir)
+        self.n_repos = n_repos
+        self.latency = latency
+        self.fork_delay = fork_delay
+        self.per_page_max = per_page_max
+        self.search_cap = search_cap
+        self.rate_limit = rate_limit
+        self.rate_limit_window = rate_limit_window
+        self.secondary_every = secondary_every
+        self.retry_after = retry_after
+        self.retry_after_date = retry_after_date
+        self.calls = Counter() # 'VERB /route' -> count
+        self.token_calls = Counter() # access token -> count
+        self.forks = {} # upstream full_name -> time the fork is ready
+        self._limits = {} # (token, resource) -> [remaining, reset epoch]
+        self._requests = 0
+        self._lock = threading.Lock()
+        self._server = None
+        make_fixtures(self.fixture_dir, n_repos)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        handler = type('Handler', (FakeGithubHandler,), {'github': self})
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset(self):
+        """forget the forks, calls and rate limits, e.g. between benchmark runs"""
+        with self._lock:
+            self.forks.clear()
+            self.calls.clear()
+            self.token_calls.clear()
+            self._limits.clear()
+            self._requests = 0
+
+    def count(self, route):
+        with self._lock:
+            self.calls[route] += 1
+
+    def exhaust(self, token, resource):
+        """use up token's requests of resource for this window, as another client would"""
+        with self._lock:
+            self._limits[(token, resource)] = [0, math.ceil(time.time() + self.rate_limit_window)]
+
+    def rate_limit_response(self, token, resource):
+        """the X-RateLimit-* headers for a request made with token, and (status, data) if the
+        request is rate limited, else None"""
+        now = time.time()
+        with self._lock:
+            self.token_calls[token] += 1
+            self._requests += 1
+            if not self.rate_limit:
+                return {'X-RateLimit-Limit': '5000', 'X-RateLimit-Remaining': '4999',
+                        'X-RateLimit-Reset': str(int(now) + 3600)}, None
+            window = self._limits.get((token, resource))
+            if not window or window[1] <= now:
+                window = self._limits[(token, resource)] = [self.rate_limit, math.ceil(now + self.rate_limit_window)]
+            exhausted = window[0] == 0
+            if not exhausted:
+                window[0] -= 1
+            secondary = not exhausted and self.secondary_every and self._requests % self.secondary_every == 0
+        headers = {'X-RateLimit-Limit': str(self.rate_limit), 'X-RateLimit-Remaining': str(window[0]),
+                   'X-RateLimit-Reset': str(window[1]), 'X-RateLimit-Resource': resource}
+        if exhausted:
+            return headers, (403, {'message': 'API rate limit exceeded for user.'})
+        if secondary:
+            headers['Retry-After'] = (formatdate(now + self.retry_after, usegmt=True) if self.retry_after_date
+                                      else str(self.retry_after))
+            return headers, (429, {'message': 'You have exceeded a secondary rate limit.'})
+        return headers, None
+
+    # the data
+
+    def upstream(self, name):
+        """REST json of upstream name, or None"""
+        match = re.fullmatch(r'project-(\d{4})', name)
+        if not match or int(match.group(1)) >= self.n_repos:
+            return None
+        return self._repo_json(ORG, name)
+
+    def add_repos(self, count):
+        """make count more upstream repos, which match searches from now on"""
+        make_fixtures(self.fixture_dir, self.n_repos + count)
+        with self._lock:
+            self.n_repos += count
+
+    def search(self, q):
+        """numbers of the upstream repos matching search q"""
+        matches = range(self.n_repos)
+        for field, start, end in re.findall(r'(created|pushed):(\S+)\.\.(\S+)', q):
+            start, end = (parse_time(t) for t in (start, end))
+            offset = 86400 if field == 'pushed' else 0
+            matches = [n for n in matches if start <= CREATED_START + n * CREATED_STEP + offset <= end]
+        for field, operator, t in re.findall(r'(created|pushed):([<>]=?)(\S+)', q):
+            t = parse_time(t) - (86400 if field == 'pushed' else 0)
+            compare = {'>': int.__gt__, '>=': int.__ge__, '<': int.__lt__, '<=': int.__le__}[operator]
+            matches = [n for n in matches if compare(CREATED_START + n * CREATED_STEP, t)]
+        return list(matches)
+
+    def fork(self, name):
+        """REST json of the user's fork of name, or None if there isn't one"""
+        if f"{ORG}/{name}" not in self.forks:
+            return None
+        raw = self._repo_json(USER, name)
+        raw['fork'] = True
+        raw['parent'] = raw['source'] = self.upstream(name)
+        return raw
+
+    def fork_is_ready(self, name):
+        return self.forks.get(f"{ORG}/{name}", float('inf')) <= time.monotonic()
+
+    def create_fork(self, name):
+        with self._lock:
+            self.forks.setdefault(f"{ORG}/{name}", time.monotonic() + self.fork_delay)
+        return self.fork(name)
+
+    def _repo_json(self, owner, name):
+        full_name = f"{owner}/{name}"
+        n = int(name.split('-')[1])
+        return {
+            'id': (2 if owner == USER else 1) * 1000000 + n,
+            'name': name,
+            'full_name': full_name,
+            'owner': {'login': owner, 'id': 1, 'type': 'User' if owner == USER else 'Organization'},
+            'private': False,
+            'fork': False,
+            'url': f"{self.url}/repos/{full_name}",
+            'html_url': f"{WEB_URL}/{full_name}",
+            # clones of forks come from their upstream's bare repo; the fork starts out identical
+            'git_url': 'file://' + path.join(self.fixture_dir, ORG, name + '.git'),
+            'clone_url': f"{WEB_URL}/{full_name}.git",
+            'ssh_url': f"git@github.example:{full_name}.git",
+            'default_branch': 'main',
+            'description': f"benchmark repo {n}",
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(CREATED_START + n * CREATED_STEP)),
+            'pushed_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(CREATED_START + n * CREATED_STEP + 86400)),
+            'updated_at': '2020-01-01T00:00:00Z',
+        }
+
+    def _graphql_node(self, raw):
+        node = {'name': raw['name'], 'nameWithOwner': raw['full_name'], 'url': raw['html_url'],
+                'sshUrl': raw['ssh_url'], 'defaultBranchRef': {'name': raw['default_branch']}}
+        if raw.get('parent'):
+            node['parent'] = self._graphql_node(raw['parent'])
+        else:
+            node['parent'] = None
+        return node
+
+    def graphql(self, query, variables):
+        if 'viewer' in query: # the fork index
+            forks = sorted(self.forks)
+            start = int(variables.get('cursor') or 0)
+            page = forks[start:start + 100]
+            nodes = [self._graphql_node(self.fork(full_name.split('/')[1])) for full_name in page]
+            has_next = start + 100 < len(forks)
+            return {'viewer': {'login': USER, 'repositories': {
+                'pageInfo': {'hasNextPage': has_next, 'endCursor': str(start + 100) if has_next else None},
+                'nodes': nodes}}}
+        data = {}
+        for alias, owner_var, name_var in re.findall(r'(\w+): repository\(owner: \$(\w+), name: \$(\w+)\)', query):
+            owner, name = variables[owner_var], variables[name_var]
+            raw = self.fork(name) if owner == USER else self.upstream(name)
+            data[alias] = self._graphql_node(raw) if raw else None
+        return data
+
+
+class FakeGithubHandler(BaseHTTPRequestHandler):
+    github = None
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def _handle(self, verb):
+        url = urlsplit(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'null') if length else None
+        time.sleep(self.github.latency)
+        for pattern, route, method in ROUTES:
+            if route.startswith(verb + ' '):
+                match = re.fullmatch(pattern, url.path)
+                if match:
+                    self.github.count(route)
+                    token = (self.headers.get('Authorization') or '').split(' ')[-1]
+                    resource = 'graphql' if route.endswith('/graphql') else 'search' if '/search/' in route else 'core'
+                    rate_headers, limited = self.github.rate_limit_response(token, resource)
+                    if limited:
+                        self.github.count(f"{route} ({limited[0]})")
+                        return self._send(*limited, rate_headers)
+                    status, data, headers = method(self, match, query, body)
+                    return self._send(status, data, dict(rate_headers, **(headers or {})), route)
+        self.github.count(f"{verb} (not found)")
+        self._send(404, {'message': 'Not Found'})
+
+    def _send(self, status, data, headers=None, route=None):
+        payload = json.dumps(data).encode()
+        etag = '"' + hashlib.sha1(payload).hexdigest() + '"'
+        if status == 200 and self.headers.get('If-None-Match') == etag:
+            status, payload = 304, b''
+            if route:
+                self.github.count(f"{route} (304)")
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        self.send_header('ETag', etag)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    # routes
+
+    def search(self, match, query, body):
+        per_page = min(int(query.get('per_page', 30)), self.github.per_page_max)
+        page = int(query.get('page', 1))
+        matches = self.github.search(query.get('q', ''))
+        if (page - 1) * per_page >= self.github.search_cap:
+            return 422, {'message': f"Only the first {self.github.search_cap} search results are available"}, None
+        total = min(len(matches), self.github.search_cap) # the last page is the last one that can be had
+        items = [self.github.upstream(repo_name(n)) for n in matches[(page - 1) * per_page:page * per_page]]
+        headers = {}
+        if page * per_page < total:
+            next_query = dict(query, page=page + 1, per_page=per_page)
+            next_url = f"{self.github.url}/search/repositories?" + urlencode(next_query)
+            last_query = dict(query, page=(total - 1) // per_page + 1, per_page=per_page)
+            last_url = f"{self.github.url}/search/repositories?" + urlencode(last_query)
+            headers['Link'] = f'<{next_url}>; rel="next", <{last_url}>; rel="last"'
+        return 200, {'total_count': len(matches), 'incomplete_results': False, 'items': items}, headers
+
+    def user(self, match, query, body):
+        return 200, {'login': USER, 'id': 1, 'type': 'User', 'url': f"{self.github.url}/users/{USER}"}, None
+
+    def repo(self, match, query, body):
+        owner, name = match.groups()
+        raw = self.github.fork(name) if owner == USER else self.github.upstream(name) if owner == ORG else None
+        return (200, raw, None) if raw else (404, {'message': 'Not Found'}, None)
+
+    def branch(self, match, query, body):
+        owner, name, branch = match.groups()
+        if owner == USER and not self.github.fork_is_ready(name):
+            return 404, {'message': 'Branch not found'}, None
+        if branch != 'main' or (owner == ORG and not self.github.upstream(name)):
+            return 404, {'message': 'Branch not found'}, None
+        return 200, {'name': branch, 'protected': False, 'commit': {'sha': '0' * 40}}, None
+
+    def create_fork(self, match, query, body):
+        owner, name = match.groups()
+        if owner != ORG or not self.github.upstream(name):
+            return 404, {'message': 'Not Found'}, None
+        return 202, self.github.create_fork(name), None
+
+    def graphql(self, match, query, body):
+        return 200, {'data': self.github.graphql(body['query'], body.get('variables') or {})}, None
+
+
+ROUTES = [
+    (r'/search/repositories', 'GET /search/repositories', FakeGithubHandler.search),
+    (r'/user', 'GET /user', FakeGithubHandler.user),
+    (r'/repos/([^/]+)/([^/]+)', 'GET /repos/:owner/:repo', FakeGithubHandler.repo),
+    (r'/repos/([^/]+)/([^/]+)/branches/([^/]+)', 'GET /repos/:owner/:repo/branches/:branch', FakeGithubHandler.branch),
+    (r'/repos/([^/]+)/([^/]+)/forks', 'POST /repos/:owner/:repo/forks', FakeGithubHandler.create_fork),
+    (r'/graphql', 'POST /graphql', FakeGithubHandler.graphql),
+]
@@ -1,10 +1,14 @@
 #!/usr/bin/env python
 """Usage:
-  fixorigin.py [(-v|--verbose) --test (-t ACCESS_TOKEN|-f ACCESS_TOKEN_FILE)] DIR
+  fixorigin.py [(-v|--verbose) --test --verify --jobs=<n> (-t ACCESS_TOKEN|-f ACCESS_TOKEN_FILE)]
+               [--ignore=<globs> --max-depth=<n>]
+               [--cache-dir=<dir> | --no-cache] [--trace=<file> --stats] DIR
   fixorigin.py (-h|--help)
 
 Search for Github repositories in DIR using Github oAuth specified by ACCESS_TOKEN
 or in ACCESS_TOKEN_FILE; for every git found under DIR make sure remote origin set to clone_url.
+The clone_url is worked out from the existing origin without calling Github, unless --verify
+is given. Origins that aren't on Github are left alone.
 
 Arguments:
   DIR            root directory to search for gits
@@ -13,8 +17,19 @@ Options:
   -h --help             show this screen.
   -v --verbose          verbose mode
   --test                test mode
-  -t ACCESS_TOKEN       specify ACCESS_TOKEN directly, takes precedence over ACCESS_TOKEN_FILE
-  -f ACCESS_TOKEN_FILE  specify file in working directory with ACCESS_TOKEN [default: .oAuth]
+  --verify              look every origin up on Github, to catch renamed or transferred repos
+  --jobs=<n>            fix up to <n> repositories at once [default: 8]
+  --ignore=<globs>      comma-separated globs of directories not to look for gits in,
+                        besides node_modules, virtualenvs and caches
+  --max-depth=<n>       only look for gits up to <n> directories below DIR
+  -t ACCESS_TOKEN       specify ACCESS_TOKEN directly, takes precedence over ACCESS_TOKEN_FILE;
+                        separate several tokens with commas to pool them
+  -f ACCESS_TOKEN_FILE  specify file in working directory with ACCESS_TOKEN, one per line [default: .oAuth]
+  --cache-dir=<dir>     keep Github API responses in <dir> [default: ~/.cache/githubtools]
+  --no-cache            don't use the API response cache
+  --trace=<file>        append a JSON line for every API call, clone, remote edit and
+                        directory walk to <file>
+  --stats               print counts and timings of those when done
 """
 from docopt import docopt
 
@@ -26,18 +41,25 @@ if __name__ == '__main__':
 	if TEST or VERBOSE:
 		print(config)
 
-from githubtools import Githubtool
+from githubtools import Githubtool, Tracer
+
+tracer = Tracer(config['--trace']) if config['--trace'] or config['--stats'] else None
 
 ght = Githubtool(VERBOSE,
                  TEST,
                  clone_dir=rootDir,
                  access_token_file=config['-f'],
-                 access_token=config['-t'])
-
-for repo in ght.local_repos:
-    try:
-        ght.set_origin(repo)
-    except:
-        if TEST or VERBOSE:
-            print(f"{repo.path} doesn't have an origin.")
+                 access_token=config['-t'],
+                 cache_dir=None if config['--no-cache'] else config['--cache-dir'],
+                 tracer=tracer,
+                 ignore=config['--ignore'].split(',') if config['--ignore'] else (),
+                 max_depth=config['--max-depth'])
+
+# with --verify, origins are looked up 100 repos per query
+ght.set_origins(ght.local_repos, offline=not config['--verify'], workers=config['--jobs'])
+
+if tracer:
+	if config['--stats']:
+		print(tracer.summary())
+	tracer.close()
         
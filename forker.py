@@ -1,8 +1,10 @@
 #!/usr/bin/env python
 """Usage:
-  forker.py [(-v|--verbose) -n <max> --test  --fork --clone  --upstream --old]
-            [--locals=<list>  --dir=<dir>]
-            [(-t ACCESS_TOKEN|-f ACCESS_TOKEN_FILE) --user=<username>] KEYWORD ...
+  forker.py [(-v|--verbose) -n <max> --test  --fork --clone  --upstream --old --sequential --resume]
+            [--shard-by=<date> --watch --interval=<sec> --max-interval=<sec> --watch-state=<file>]
+            [--locals=<list>  --dir=<dir> --jobs=<n> --wait=<sec> --journal=<file>] [--cache-dir=<dir> | --no-cache]
+            [--depth=<n> --single-branch --filter=<spec> --mirror-dir=<dir> --trace=<file> --stats]
+            [(-t ACCESS_TOKEN|-f ACCESS_TOKEN_FILE) --user=<username> --api-url=<url>] KEYWORD ...
   forker.py (-h|--help)
 
 Search for Github repositories matching KEYWORDs using Github oAuth specified by ACCESS_TOKEN
@@ -16,23 +18,46 @@ Options:
   -h --help             show this screen.
   -v --verbose          verbose mode
   -n <max>              specify <max> limit of matching repositories
+  --shard-by=<date>     split the search into ranges of created or pushed <date>, to find
+                        more than the 1,000 repos Github gives for one search
   --test                test mode (no write)
   --fork                fork matching repositories
   --clone               clone matching forked repositories, if they exist
   --upstream            add remote upstream to cloned repos, if they exist
   --old                 add already forked repositories to cloning list
-  --locals=<list>       specify file name where names of local repos are listed [default: git_list]
+  --sequential          finish each phase for all repositories before starting the next,
+                        instead of streaming each repository through the phases
+  --watch               keep running, and put only the repos that are new since the last
+                        poll through the phases; quiet polls are answered from the cache
+  --interval=<sec>      with --watch, poll every <sec> seconds at first [default: 60]
+  --max-interval=<sec>  with --watch, poll less and less often while nothing turns up, down
+                        to every <sec> seconds [default: 900]
+  --watch-state=<file>  with --watch, remember the newest repo seen in <file> [default: .watch_state]
+  --resume              pick up an interrupted run of the same search where it stopped,
+                        skipping the repos its journal says are done, without asking Github
+  --journal=<file>      record each repo's progress in <file> [default: .forker_journal]
+  --locals=<list>       specify file name of the index of local repos [default: git_list]
   --dir=<dir>           specify parent <dir> in which to clone repositories [default: .]
-  -t ACCESS_TOKEN       specify ACCESS_TOKEN directly, takes precedence over ACCESS_TOKEN_FILE
-  -f ACCESS_TOKEN_FILE  specify file in working directory with ACCESS_TOKEN [default: .oAuth]
+  --jobs=<n>            clone up to <n> repositories (or fetch up to <n> search pages) at once [default: 4]
+  --wait=<sec>          give up on forks Github hasn't finished after <sec> seconds [default: 120]
+  --depth=<n>           only clone the last <n> commits of history
+  --single-branch       only clone the default branch
+  --filter=<spec>       partial clone, e.g. --filter=blob:none (needs git installed)
+  --mirror-dir=<dir>    clone forks from local bare mirrors of their upstreams kept in <dir>,
+                        so each upstream's history is only downloaded once
+  -t ACCESS_TOKEN       specify ACCESS_TOKEN directly, takes precedence over ACCESS_TOKEN_FILE;
+                        separate several tokens with commas to pool them
+  -f ACCESS_TOKEN_FILE  specify file in working directory with ACCESS_TOKEN, one per line [default: .oAuth]
   --user=<username>     specify user for search (optional)
+  --api-url=<url>       Github API URL, e.g. of Github Enterprise (default: https://api.github.com)
+  --cache-dir=<dir>     keep Github API responses in <dir> [default: ~/.cache/githubtools]
+  --no-cache            don't use the API response cache
+  --trace=<file>        append a JSON line for every API call, clone, remote edit and
+                        directory walk to <file>
+  --stats               print counts and timings of those when done
 """
-import time
 from docopt import docopt
 
-from githubtools import Githubtool
-
-
 
 if __name__ == '__main__':
     arguments = docopt(__doc__)
@@ -41,6 +66,20 @@ if __name__ == '__main__':
     VERBOSE = arguments['--verbose']
     USER = arguments['--user']
     MAXNUM = arguments.get('-n', None)
+    SHARD_BY = arguments['--shard-by']
+    # imported after parsing, so --help doesn't wait for PyGithub and pygit2
+    from githubtools import Githubtool, Tracer, JobJournal
+    CLONE_OPTIONS = {'depth': arguments['--depth'],
+                     'single_branch': arguments['--single-branch'],
+                     'blob_filter': arguments['--filter']}
+    TRACER = Tracer(arguments['--trace']) if arguments['--trace'] or arguments['--stats'] else None
+    # the same search with the same limit is the same job
+    JOB = {'keywords': KEYWORD, 'user': USER, 'max': MAXNUM}
+    if SHARD_BY: # a sharded search finds other repos
+        JOB['shard_by'] = SHARD_BY
+    # a watch keeps track of what it has done in its state file instead
+    JOURNAL = None if TEST or arguments['--watch'] else JobJournal(arguments['--journal'], job=JOB,
+                                                                   resume=arguments['--resume'])
     if TEST or VERBOSE:
         print(arguments)
 
@@ -52,21 +91,74 @@ githubtool = Githubtool(VERBOSE,
                         arguments['--locals'],
                         arguments['--dir'],
                         arguments['-f'],
-                        arguments['-t'])
-
-repos = githubtool.search_github_repos(KEYWORD, USER, MAXNUM)
-
-if arguments['--fork']:
-    forked_repos = githubtool.fork_repos(repos, arguments['--old'])
-
-if VERBOSE:
-    print("Waiting 5 seconds to give Github time to complete the forks.")
-time.sleep(5)
-
-if arguments['--clone']:
-    cloned_repos = githubtool.clone_repos(forked_repos)
-
-# add upstream connection
-
-if arguments['--upstream']:
-    upstream_remotes = githubtool.add_upstream_repos(cloned_repos)
+                        arguments['-t'],
+                        cache_dir=None if arguments['--no-cache'] else arguments['--cache-dir'],
+                        base_url=arguments['--api-url'],
+                        mirror_dir=arguments['--mirror-dir'],
+                        tracer=TRACER,
+                        journal=JOURNAL)
+
+STAGES = arguments['--fork'] or arguments['--clone'] or arguments['--upstream']
+
+if arguments['--watch']:
+    try:
+        for item in githubtool.watch(KEYWORD, USER,
+                                     interval=arguments['--interval'],
+                                     max_interval=arguments['--max-interval'],
+                                     state_file=arguments['--watch-state'],
+                                     shard_by=SHARD_BY,
+                                     fork=arguments['--fork'],
+                                     clone=arguments['--clone'],
+                                     upstream=arguments['--upstream'],
+                                     include_old=arguments['--old'],
+                                     workers=arguments['--jobs'],
+                                     fork_timeout=arguments['--wait'],
+                                     **CLONE_OPTIONS):
+            if item.error:
+                print(f"{item.repo.full_name} failed at {item.stage}: {item.error}")
+            elif not STAGES:
+                print(f"{item.repo.full_name}\t{item.repo.clone_url}")
+    except KeyboardInterrupt:
+        pass
+elif STAGES and not arguments['--sequential']:
+    # each repo goes search -> fork -> clone -> upstream on its own, overlapping with the others
+    for item in githubtool.pipeline(KEYWORD, USER, MAXNUM,
+                                    fork=arguments['--fork'],
+                                    clone=arguments['--clone'],
+                                    upstream=arguments['--upstream'],
+                                    include_old=arguments['--old'],
+                                    workers=arguments['--jobs'],
+                                    fork_timeout=arguments['--wait'],
+                                    shard_by=SHARD_BY,
+                                    **CLONE_OPTIONS):
+        if item.error:
+            print(f"{item.repo.full_name} failed at {item.stage}: {item.error}")
+else:
+    repos = githubtool.search_github_repos(KEYWORD, USER, MAXNUM, SHARD_BY, arguments['--jobs'])
+
+    if arguments['--fork']:
+        forked_repos = githubtool.fork_repos(repos, arguments['--old'])
+    elif arguments['--clone'] or arguments['--upstream']:
+        # the forks made before, from the journal or the user's fork index
+        forked_repos = [handle for handle in (githubtool._fork_repo(repo, create=False) for repo in repos)
+                        if handle]
+
+    if arguments['--clone'] or arguments['--upstream']:
+        # each fork moves on to cloning as soon as Github has finished creating it;
+        # without --clone, the clones already under --dir are used
+        ready_repos = githubtool.wait_for_forks(forked_repos, timeout=arguments['--wait'])
+        cloned_repos = githubtool.clone_repos(ready_repos, clone=arguments['--clone'], workers=arguments['--jobs'],
+                                              **CLONE_OPTIONS)
+
+    # add upstream connection
+
+    if arguments['--upstream']:
+        upstream_remotes = githubtool.add_upstream_repos(cloned_repos)
+
+if JOURNAL:
+    JOURNAL.close()
+
+if TRACER:
+    if arguments['--stats']:
+        print(TRACER.summary())
+    TRACER.close()
@@ -1,7 +1,8 @@
 #!/usr/bin/env python
 """Usage:
   forkone.py [(-v|--verbose) --test  --fork --clone --old --upstream]
-             [--locals=<list>  --dir=<dir>]
+             [--locals=<list>  --dir=<dir> --wait=<sec>] [--cache-dir=<dir> | --no-cache]
+             [--depth=<n> --single-branch --filter=<spec> --mirror-dir=<dir> --trace=<file> --stats]
              [(-t ACCESS_TOKEN|-f ACCESS_TOKEN_FILE)] REPO
   forkone.py (-h|--help)
 
@@ -20,20 +21,33 @@ Options:
   --clone               clone matching forked repository, if it exists
   --upstream            add remote upstream to cloned repo, if it exists
   --old                 do clone and/or upstream even if repository already forked
-  --locals=<list>       specify file name where names of local repos are listed [default: git_list]
+  --locals=<list>       specify file name of the index of local repos [default: git_list]
   --dir=<dir>           specify <dir> to clone repository into [default: ..]
-  -t ACCESS_TOKEN       specify ACCESS_TOKEN directly, takes precedence over ACCESS_TOKEN_FILE
-  -f ACCESS_TOKEN_FILE  specify file in working directory with ACCESS_TOKEN [default: .oAuth]
+  --wait=<sec>          give up if Github hasn't finished the fork after <sec> seconds [default: 120]
+  --depth=<n>           only clone the last <n> commits of history
+  --single-branch       only clone the default branch
+  --filter=<spec>       partial clone, e.g. --filter=blob:none (needs git installed)
+  --mirror-dir=<dir>    clone forks from local bare mirrors of their upstreams kept in <dir>,
+                        so each upstream's history is only downloaded once
+  -t ACCESS_TOKEN       specify ACCESS_TOKEN directly, takes precedence over ACCESS_TOKEN_FILE;
+                        separate several tokens with commas to pool them
+  -f ACCESS_TOKEN_FILE  specify file in working directory with ACCESS_TOKEN, one per line [default: .oAuth]
+  --cache-dir=<dir>     keep Github API responses in <dir> [default: ~/.cache/githubtools]
+  --no-cache            don't use the API response cache
+  --trace=<file>        append a JSON line for every API call, clone, remote edit and
+                        directory walk to <file>
+  --stats               print counts and timings of those when done
 """
-import time
 from docopt import docopt
-from githubtools import Githubtool
 
 if __name__ == '__main__':
     arguments = docopt(__doc__)
     REPO = arguments['REPO']
     TEST = arguments['--test']
     VERBOSE = arguments['--verbose']
+    # imported after parsing, so --help doesn't wait for PyGithub and pygit2
+    from githubtools import Githubtool, Tracer
+    TRACER = Tracer(arguments['--trace']) if arguments['--trace'] or arguments['--stats'] else None
     if TEST or VERBOSE:
         print(arguments)
 
@@ -50,21 +64,28 @@ githubtool = Githubtool(VERBOSE,
                         arguments['--locals'],
                         arguments['--dir'],
                         arguments['-f'],
-                        arguments['-t'])
+                        arguments['-t'],
+                        cache_dir=None if arguments['--no-cache'] else arguments['--cache-dir'],
+                        mirror_dir=arguments['--mirror-dir'],
+                        tracer=TRACER)
 
 repo = githubtool.g.get_repo(REPO)
 
 if arguments['--fork']:
     forked_repo = githubtool.fork_repos(repo, arguments['--old'])
 
-# we need to give Github time to complete the fork. It would be good to have this be a
-# while that can check if the fork is completed and then wait longer
-if VERBOSE:
-    print("Waiting 3 seconds to give Github time to complete the fork.")
-time.sleep(3)
-
 if arguments['--clone']:
-    cloned_repo = githubtool.clone_repos(forked_repo)
+    # poll until Github has finished the fork instead of sleeping a fixed time
+    ready_repo = githubtool.wait_for_forks(forked_repo, timeout=arguments['--wait'])
+    cloned_repo = githubtool.clone_repos(ready_repo,
+                                         depth=arguments['--depth'],
+                                         single_branch=arguments['--single-branch'],
+                                         blob_filter=arguments['--filter'])
 
 if arguments['--upstream']:
     upstream_remote = githubtool.add_upstream_repos(cloned_repo)
+
+if TRACER:
+    if arguments['--stats']:
+        print(TRACER.summary())
+    TRACER.close()
@@ -19,16 +19,35 @@ Githubtool(
     locals_file='git_list',
     clone_dir='..',
     access_token_file='.oAuth',
-    access_token=None
+    access_token=None,
+    cache_dir=None,
+    base_url=None,
+    mirror_dir=None
 )
 """
 import sys
 import os
+import time
+import heapq
+import threading
+import queue
+import itertools
+import json
+import hashlib
+import subprocess
+import re
+import fnmatch
+import calendar
 from os import path
-from docopt import docopt
+from urllib.parse import urlsplit
+from email.utils import parsedate_to_datetime
+from collections import namedtuple, Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED
+from concurrent.futures import wait as wait_futures
 
-# library to the Github API
-from github import Github
+# PyGithub (the library to the Github API) and requests, its HTTP dependency, take most of
+# the time to import; they're imported where the Github client is used, so that work on
+# local repos alone (sync_upstreams, offline set_origins) doesn't wait for them
 
 # for local git commands
 import pygit2
@@ -37,12 +56,6 @@ import pygit2
 import giturlparse
 
 
-if __name__ == '__main__':
-    CONFIG = docopt(__doc__)
-    if CONFIG['--test'] or CONFIG['--verbose']:
-        print(CONFIG)
-
-
 # get a list of the github repositories we need to fork
 # https://python.gotrained.com/search-github-api/
 # https://pygithub.readthedocs.io/en/latest/introduction.html
@@ -52,6 +65,955 @@ if __name__ == '__main__':
 # get token
 
 
+# all of the user's forks with their parents, 100 per page. The REST repo listing
+# doesn't include parent, so using it would cost an extra GET per fork.
+FORK_INDEX_QUERY = """
+query($cursor: String) {
+  viewer {
+    login
+    repositories(first: 100, after: $cursor, isFork: true, ownerAffiliations: OWNER) {
+      pageInfo { hasNextPage endCursor }
+      nodes {
+        name nameWithOwner url sshUrl defaultBranchRef { name }
+        parent { name nameWithOwner url sshUrl defaultBranchRef { name } }
+      }
+    }
+  }
+}"""
+
+# fields resolve_repos fetches for each repository
+REPO_FIELDS = """
+fragment repoFields on Repository {
+  name nameWithOwner url sshUrl defaultBranchRef { name }
+  parent { name nameWithOwner url sshUrl defaultBranchRef { name } }
+}"""
+
+# PyGithub's Consts.DEFAULT_BASE_URL
+DEFAULT_API_URL = 'https://api.github.com'
+
+# where watch keeps API responses if Githubtool wasn't given a cache_dir
+DEFAULT_CACHE_DIR = '~/.cache/githubtools'
+# cache_dir that wasn't given, as opposed to None for no cache
+CACHE_DIR_UNSET = object()
+
+# Github returns at most this many results for a search, however many match
+SEARCH_CAP = 1000
+# no repo on Github was created before this (epoch seconds); where sharded searches start
+SEARCH_EPOCH = calendar.timegm((2007, 10, 1, 0, 0, 0))
+
+# Repository fields a JobJournal keeps of each repo and fork
+JOURNAL_FIELDS = ('id', 'name', 'full_name', 'url', 'html_url', 'clone_url', 'git_url', 'ssh_url',
+                  'fork', 'default_branch')
+
+# result of cloning one repo: status is one of 'cloned', 'existing', 'skipped', 'failed'
+CloneResult = namedtuple('CloneResult', ['repo', 'status', 'local_repo', 'error'])
+
+# result of syncing one repo's upstream: status is one of 'fetched', 'fast-forwarded',
+# 'unchanged', 'diverged', 'no upstream', 'failed'
+SyncResult = namedtuple('SyncResult', ['name', 'path', 'status', 'detail'])
+
+# how far one repo's local branch is from upstream's: status is one of 'up to date', 'ahead',
+# 'behind', 'diverged', 'no upstream', 'failed'; ahead and behind are commit counts
+DivergenceResult = namedtuple('DivergenceResult', ['name', 'path', 'branch', 'ahead', 'behind', 'status', 'detail'])
+
+# one operation of a reconcile plan: action is one of 'fork', 'clone', 'set origin', 'add upstream',
+# 'set upstream', 'missing' for a repo that isn't on Github, or 'conflict' for one whose clone
+# directory holds an unrelated repo; target is the repo to act on
+ReconcileStep = namedtuple('ReconcileStep', ['action', 'full_name', 'target', 'detail'])
+
+
+def _ahead_behind(gitdir, local, upstream):
+    """(ahead, behind, error) of commit local against commit upstream (hex OIDs) in the repo at
+    gitdir. Runs in Githubtool.divergence_report's worker processes, so takes only strings."""
+    try:
+        ahead, behind = pygit2.Repository(gitdir).ahead_behind(local, upstream)
+        return ahead, behind, None
+    except Exception as err:
+        return None, None, str(err)
+
+
+class Tracer:
+    """Counts and times Githubtool's API calls, rate limit waits, clones, fetches,
+    remote edits and directory walks. Each one is a span; with trace_file, every span
+    is also written to it as a JSON line. A disabled tracer's spans do nothing."""
+    def __init__(self, trace_file=None, enabled=True):
+        self.enabled = enabled
+        self.trace_file = open(trace_file, 'a') if trace_file and enabled else None
+        self.started = time.time()
+        self.counts = Counter() # op -> spans
+        self.seconds = Counter() # op -> total seconds
+        self.longest = Counter() # op -> longest span
+        self.errors = Counter() # op -> spans that raised
+        self.rate_limit_remaining = {} # resource -> lowest X-RateLimit-Remaining seen
+        self._lock = threading.Lock()
+
+    def span(self, op, **fields):
+        """context manager timing op; it gives a dict for fields to record with the span"""
+        return Span(self, op, fields) if self.enabled else NO_SPAN
+
+    def record(self, op, seconds, fields=None, start=None, error=None):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counts[op] += 1
+            self.seconds[op] += seconds
+            self.longest[op] = max(self.longest[op], seconds)
+            if error is not None:
+                self.errors[op] += 1
+            remaining = (fields or {}).get('rate_limit_remaining')
+            if remaining is not None:
+                resource = fields.get('resource') or 'core'
+                self.rate_limit_remaining[resource] = min(remaining, self.rate_limit_remaining.get(resource, remaining))
+            if self.trace_file:
+                event = {'op': op, 'start': round((start or time.time() - seconds) - self.started, 6),
+                         'seconds': round(seconds, 6), 'thread': threading.current_thread().name}
+                event.update(fields or {})
+                if error is not None:
+                    event['error'] = repr(error)
+                self.trace_file.write(json.dumps(event, default=str) + '\n')
+
+    def summary(self):
+        """table of count, total and longest seconds and errors per op"""
+        lines = [f"{'op':<16} {'count':>7} {'seconds':>9} {'mean ms':>9} {'max ms':>9} {'errors':>6}"]
+        for op in sorted(self.counts):
+            count, seconds = self.counts[op], self.seconds[op]
+            lines.append(f"{op:<16} {count:>7} {seconds:>9.2f} {1000 * seconds / count:>9.1f}"
+                         f" {1000 * self.longest[op]:>9.1f} {self.errors[op]:>6}")
+        if self.rate_limit_remaining:
+            lines.append("lowest rate limit remaining: " +
+                         ', '.join(f"{resource} {n}" for resource, n in sorted(self.rate_limit_remaining.items())))
+        lines.append(f"wall time {time.time() - self.started:.2f}s")
+        return '\n'.join(lines)
+
+    def close(self):
+        if self.trace_file:
+            self.trace_file.close()
+            self.trace_file = None
+
+
+class Span:
+    """one timed operation of a Tracer"""
+    __slots__ = ('tracer', 'op', 'fields', 'start', 'clock')
+
+    def __init__(self, tracer, op, fields):
+        self.tracer = tracer
+        self.op = op
+        self.fields = fields
+
+    def __enter__(self):
+        self.start = time.time()
+        self.clock = time.perf_counter()
+        return self.fields
+
+    def __exit__(self, exc_type, exc, tb):
+        self.tracer.record(self.op, time.perf_counter() - self.clock, self.fields, self.start, exc)
+        return False
+
+
+class NoSpan:
+    """what a disabled Tracer gives instead of a Span"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return {}
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NO_SPAN = NoSpan()
+DISABLED_TRACER = Tracer(enabled=False)
+
+
+class CachedResponse:
+    """httplib-style response served from HTTPCache, in the form PyGithub's Requester reads"""
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def getheaders(self):
+        return self.headers.items()
+
+    def read(self):
+        return self.body
+
+
+class HTTPCache:
+    """On-disk cache of Github API GET responses that carry an ETag or Last-Modified.
+    One JSON file per response under cache_dir. When the files add up to more
+    than max_size bytes, the least recently used ones are removed."""
+    def __init__(self, cache_dir, max_size=64 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._size = sum(entry.stat().st_size for entry in os.scandir(cache_dir) if entry.name.endswith('.json'))
+
+    @staticmethod
+    def key(url, headers):
+        """cache key for a request; responses differ by token and media type"""
+        parts = [url, headers.get('Accept', ''), headers.get('Authorization', '')]
+        return hashlib.sha256('\n'.join(parts).encode()).hexdigest()
+
+    def _path(self, key):
+        return path.join(self.cache_dir, key + '.json')
+
+    def get(self, key):
+        """cached entry for key, or None"""
+        try:
+            with open(self._path(key)) as entry_file:
+                entry = json.load(entry_file)
+            os.utime(self._path(key)) # mark as recently used
+        except (OSError, ValueError):
+            return None
+        return entry
+
+    def put(self, key, entry):
+        """store entry, evicting old entries if the cache is over max_size"""
+        data = json.dumps(entry)
+        tmp_file = f"{self._path(key)}.{threading.get_ident()}.tmp"
+        with self._lock:
+            old_size = path.getsize(self._path(key)) if path.exists(self._path(key)) else 0
+            with open(tmp_file, 'w') as entry_file:
+                entry_file.write(data)
+            os.replace(tmp_file, self._path(key))
+            self._size += len(data) - old_size
+            if self._size > self.max_size:
+                self._evict()
+
+    def _evict(self):
+        """remove least recently used entries until the cache is 3/4 full"""
+        entries = sorted((entry.stat().st_mtime, entry.stat().st_size, entry.path)
+                         for entry in os.scandir(self.cache_dir) if entry.name.endswith('.json'))
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, entry_path in entries:
+            if self._size <= self.max_size * 3 // 4:
+                break
+            try:
+                os.remove(entry_path)
+            except OSError:
+                continue
+            self._size -= size
+
+    def clear(self):
+        """remove every entry"""
+        with self._lock:
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith('.json'):
+                    os.remove(entry.path)
+            self._size = 0
+
+
+class TokenBucket:
+    """Allows rate calls per second on average, in bursts of up to capacity"""
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self):
+        """wait until a call is allowed; returns the seconds waited"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class RateLimitScheduler:
+    """Decides when each API request may be sent, and with which access token.
+    Tracks the X-RateLimit-* headers per token and resource (core, search,
+    graphql), and paces reads and writes with token buckets to stay under
+    Github's secondary limits. Rate-limited responses (403/429) block the token
+    for Retry-After, or until X-RateLimit-Reset, and the request goes out on
+    the next free token. Only GETs of /repos/ and /search/ are spread across
+    tokens; everything else uses the first token, whose user owns the forks.
+    With paced=False only the rate limit headers and responses are obeyed."""
+    tracer = DISABLED_TRACER
+
+    def __init__(self, tokens, read_rate=15, write_rate=1, max_retries=5, is_verbose=False, paced=True):
+        self.tokens = list(tokens)
+        self.paced = paced
+        self.max_retries = max_retries
+        self.is_verbose = is_verbose
+        self.limits = {} # (token, resource) -> [remaining, reset epoch]
+        self.blocked = {} # token -> epoch when a secondary limit lifts
+        self.reads = {token: TokenBucket(read_rate, 4 * read_rate) for token in self.tokens}
+        self.writes = {token: TokenBucket(write_rate, 5) for token in self.tokens}
+        self.waited = 0
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def resource(url):
+        """which rate limit a request counts against"""
+        url_path = urlsplit(url).path
+        if url_path.endswith('/graphql'):
+            return 'graphql'
+        if '/search/' in url_path:
+            return 'search'
+        return 'core'
+
+    @staticmethod
+    def is_shareable(verb, url):
+        """can this request be made with any token in the pool?"""
+        return verb == 'GET' and re.search(r'/(repos|search)/', urlsplit(url).path) is not None
+
+    def acquire(self, verb, url):
+        """wait until a token may make this request, and return it"""
+        resource = self.resource(url)
+        candidates = self.tokens if self.is_shareable(verb, url) else self.tokens[:1]
+        while True:
+            with self._lock:
+                now = time.time()
+                best, best_remaining, ready_at = None, -1, None
+                for token in candidates:
+                    remaining, reset = self.limits.get((token, resource), (None, 0))
+                    token_ready_at = self.blocked.get(token, 0)
+                    if remaining is not None and remaining <= 0:
+                        token_ready_at = max(token_ready_at, reset + 1)
+                    if token_ready_at > now:
+                        ready_at = token_ready_at if ready_at is None else min(ready_at, token_ready_at)
+                    else:
+                        remaining = float('inf') if remaining is None else remaining
+                        if remaining > best_remaining:
+                            best, best_remaining = token, remaining
+                if best is not None:
+                    if (best, resource) in self.limits:
+                        self.limits[(best, resource)][0] -= 1 # until the response says otherwise
+                    break
+            self._wait(ready_at - now, f"{resource} rate limit")
+        # the only GraphQL we send are queries, so they're paced as reads
+        is_read = verb in ('GET', 'HEAD') or resource == 'graphql'
+        if self.paced:
+            bucket = self.reads[best] if is_read else self.writes[best]
+            wait = bucket.take()
+            if wait:
+                self.waited += wait
+                self.tracer.record('pacing', wait, {'resource': resource})
+        return best
+
+    def update(self, token, url, headers):
+        """record the X-RateLimit-* headers of a response"""
+        if 'X-RateLimit-Remaining' not in headers:
+            return
+        resource = headers.get('X-RateLimit-Resource', self.resource(url))
+        with self._lock:
+            self.limits[(token, resource)] = [int(headers['X-RateLimit-Remaining']),
+                                              int(headers.get('X-RateLimit-Reset', 0))]
+
+    def retry_after(self, token, response, attempt):
+        """if response was rate limited, block token and return True to retry the request"""
+        if response.status_code not in (403, 429) or attempt >= self.max_retries:
+            return False
+        headers = response.headers
+        now = time.time()
+        retry_after = self.retry_after_seconds(headers.get('Retry-After'), now)
+        if retry_after is not None:
+            until = now + retry_after
+        elif headers.get('X-RateLimit-Remaining') == '0':
+            until = int(headers.get('X-RateLimit-Reset', now + 60)) + 1
+        elif 'rate limit' in response.text.lower():
+            until = now + min(60 * 2 ** attempt, 900) # secondary limit without Retry-After
+        else: # a real 403
+            return False
+        with self._lock:
+            self.blocked[token] = max(self.blocked.get(token, 0), until)
+        self.retries += 1
+        if self.is_verbose:
+            print(f"Rate limited ({response.status_code}), holding token ...{token[-4:]} for {int(until - now)}s")
+        return True
+
+    @staticmethod
+    def retry_after_seconds(value, now):
+        """seconds to wait for a Retry-After header, given as seconds or as an HTTP date;
+        None if there isn't one or it can't be read"""
+        if not value:
+            return None
+        try:
+            return max(0, int(value))
+        except ValueError:
+            pass
+        try:
+            return max(0, parsedate_to_datetime(value).timestamp() - now)
+        except (TypeError, ValueError):
+            return None
+
+    def _wait(self, seconds, reason):
+        if self.is_verbose:
+            print(f"Waiting {int(seconds)}s for the {reason} to reset.")
+        self.waited += seconds
+        with self.tracer.span('rate_limit_wait', reason=reason):
+            time.sleep(seconds)
+
+
+class GithubTransport:
+    """Carries PyGithub's HTTP requests over one shared requests.Session.
+    GET responses are kept in an optional HTTPCache and revalidated with
+    If-None-Match/If-Modified-Since; a 304 doesn't count against the rate limit.
+    With a RateLimitScheduler, each request waits its turn and may go out with
+    another pooled token.
+    install() makes every Github client in the process use this transport."""
+    tracer = DISABLED_TRACER
+
+    def __init__(self, cache=None, scheduler=None):
+        import requests
+        from github.Requester import Requester
+        self.cache = cache
+        self.scheduler = scheduler
+        self.session = requests.Session()
+        # as in PyGithub: stop requests from falling back to .netrc
+        self.session.auth = Requester.noopAuth
+        self._mounted = False
+        self._lock = threading.Lock()
+
+    def install(self):
+        """inject connection classes bound to this transport into PyGithub's Requester"""
+        from github.Requester import Requester
+        http_class = type('HTTPTransportConnection', (TransportConnection,), {'transport': self, 'protocol': 'http'})
+        https_class = type('HTTPSTransportConnection', (TransportConnection,), {'transport': self, 'protocol': 'https'})
+        Requester.injectConnectionClasses(http_class, https_class)
+
+    def mount(self, retry=None, pool_size=None):
+        """set up the session's connection pool, once, with the Requester's retry policy"""
+        import requests.adapters
+        with self._lock:
+            if self._mounted:
+                return
+            adapter = requests.adapters.HTTPAdapter(
+                max_retries=requests.adapters.DEFAULT_RETRIES if retry is None else retry,
+                pool_connections=pool_size or requests.adapters.DEFAULT_POOLSIZE,
+                pool_maxsize=max(pool_size or 0, 32), # room for worker threads
+            )
+            self.session.mount('http://', adapter)
+            self.session.mount('https://', adapter)
+            self._mounted = True
+
+    def request(self, verb, url, body, headers, stream=False, timeout=None, verify=True):
+        """send one request; returns an httplib-style response"""
+        with self.tracer.span('api', verb=verb, url=url) as span:
+            response = self._request(verb, url, body, headers, stream, timeout, verify)
+            span['status'] = response.status
+            span['cached'] = isinstance(response, CachedResponse)
+            if 'X-RateLimit-Remaining' in response.headers:
+                span['rate_limit_remaining'] = int(response.headers['X-RateLimit-Remaining'])
+                span['resource'] = response.headers.get('X-RateLimit-Resource')
+            return response
+
+    def _request(self, verb, url, body, headers, stream, timeout, verify):
+        """request, answering revalidated GETs from the cache"""
+        from github.Requester import RequestsResponse
+        key = entry = None
+        if self.cache and verb == 'GET' and not stream:
+            key = self.cache.key(url, headers)
+            entry = self.cache.get(key)
+            if entry:
+                headers = dict(headers)
+                if entry.get('etag'):
+                    headers['If-None-Match'] = entry['etag']
+                if entry.get('last_modified'):
+                    headers['If-Modified-Since'] = entry['last_modified']
+        response = self._send(verb, url, body, headers, stream, timeout, verify)
+        if entry and response.status_code == 304:
+            self.cache.hits += 1
+            response_headers = dict(entry['headers'])
+            response_headers.update(response.headers) # fresh rate limit headers
+            return CachedResponse(entry['status'], response_headers, entry['body'])
+        if key and response.status_code == 200:
+            self.cache.misses += 1
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            if etag or last_modified:
+                self.cache.put(key, {'url': url, 'status': 200, 'headers': dict(response.headers),
+                                     'body': response.text, 'etag': etag, 'last_modified': last_modified})
+        return RequestsResponse(response)
+
+    def _send(self, verb, url, body, headers, stream, timeout, verify):
+        """send a request, through the scheduler if there is one"""
+        if not self.scheduler:
+            return self.session.request(verb, url, headers=headers, data=body, timeout=timeout,
+                                        verify=verify, allow_redirects=False, stream=stream)
+        attempt = 0
+        while True:
+            token = self.scheduler.acquire(verb, url)
+            if 'Authorization' in headers and len(self.scheduler.tokens) > 1:
+                headers = dict(headers, Authorization=f"token {token}")
+            response = self.session.request(verb, url, headers=headers, data=body, timeout=timeout,
+                                            verify=verify, allow_redirects=False, stream=stream)
+            self.scheduler.update(token, url, response.headers)
+            if not self.scheduler.retry_after(token, response, attempt):
+                return response
+            attempt += 1
+
+
+class TransportConnection:
+    """httplib-style connection that PyGithub's Requester creates for each request.
+    Subclasses made by GithubTransport.install() set transport and protocol."""
+    transport = None
+    protocol = 'https'
+
+    def __init__(self, host, port=None, strict=False, timeout=None, retry=None, pool_size=None, **kwargs):
+        self.host = host
+        self.port = port if port else (443 if self.protocol == 'https' else 80)
+        self.timeout = timeout
+        self.verify = kwargs.get('verify', True)
+        self.transport.mount(retry, pool_size)
+
+    def request(self, verb, url, input, headers, stream=False):
+        self.verb = verb
+        self.url = url
+        self.input = input
+        self.headers = headers
+        self.stream = stream
+
+    def getresponse(self):
+        url = f"{self.protocol}://{self.host}:{self.port}{self.url}"
+        return self.transport.request(self.verb, url, self.input, self.headers,
+                                      stream=self.stream, timeout=self.timeout, verify=self.verify)
+
+    def close(self):
+        pass # the session is shared
+
+
+class RepoRecord:
+    """The fields of a Github repo that forking, cloning and adding upstreams use, made from
+    the JSON of a search result. Unlike a PyGithub Repository, reading an attribute never
+    sends a request to Github to complete the object, and it takes a fraction of the memory."""
+    __slots__ = ('name', 'full_name', 'clone_url', 'git_url', 'fork', 'parent_full_name',
+                 'updated_at', 'default_branch', 'created_at')
+
+    def __init__(self, name, full_name, clone_url, git_url, fork=False, parent_full_name=None,
+                 updated_at=None, default_branch=None, created_at=None):
+        self.name = name
+        self.full_name = full_name
+        self.clone_url = clone_url
+        self.git_url = git_url
+        self.fork = fork
+        self.parent_full_name = parent_full_name
+        self.updated_at = updated_at
+        self.default_branch = default_branch
+        self.created_at = created_at
+
+    @classmethod
+    def from_raw(cls, raw):
+        """RepoRecord for a dict of REST fields, e.g. an item of search results"""
+        return cls(raw['name'], raw['full_name'], raw.get('clone_url'), raw.get('git_url'),
+                   raw.get('fork', False), (raw.get('parent') or {}).get('full_name'),
+                   raw.get('updated_at'), raw.get('default_branch'), raw.get('created_at'))
+
+    def raw(self):
+        """dict of REST fields, as from_raw takes them"""
+        raw = {'name': self.name, 'full_name': self.full_name, 'owner': {'login': self.full_name.split('/')[0]},
+               'clone_url': self.clone_url, 'git_url': self.git_url, 'fork': self.fork,
+               'updated_at': self.updated_at, 'default_branch': self.default_branch,
+               'created_at': self.created_at}
+        if self.parent_full_name:
+            raw['parent'] = {'full_name': self.parent_full_name}
+        return raw
+
+    def __eq__(self, other):
+        return isinstance(other, RepoRecord) and self.full_name == other.full_name
+
+    def __hash__(self):
+        return hash(self.full_name)
+
+    def __repr__(self):
+        return f"RepoRecord({self.full_name})"
+
+
+class ForkHandle:
+    """A fork returned by Githubtool.fork_repos whose readiness can be polled.
+    Attribute access falls through to the fork's Repository, so a handle can be
+    passed anywhere a repo is expected (e.g. clone_repos)."""
+    def __init__(self, repo, source=None, created=False):
+        self.repo = repo
+        self.source = source
+        self.created = created
+        # forks that already existed are ready; new ones are copied asynchronously by Github
+        self.ready = not created
+        self.polls = 0
+
+    def __getattr__(self, name):
+        return getattr(self.__dict__['repo'], name)
+
+    def __repr__(self):
+        return f"ForkHandle({self.repo.full_name}, ready={self.ready})"
+
+
+class LocalRepoIndex:
+    """Persistent index of the git repositories under clone_dir, saved as JSON in index_file.
+    For each repo it keeps the path, name and remotes; for every other directory
+    it keeps the mtime and subdirectories seen. refresh() only lists directories
+    whose mtime has changed, and only re-reads remotes when .git/config changed.
+    A directory is a repo if it has a .git entry (or is a bare repo); repos aren't looked into.
+    Directories matching an ignore glob (by name, or by path relative to clone_dir) and
+    those more than max_depth levels down aren't looked into either. The subtrees of
+    clone_dir are walked on up to workers threads."""
+    VERSION = 2
+    # never worth looking for repos in
+    IGNORE = ('node_modules', '.venv', 'venv', '__pycache__', '.tox', '.nox', '.mypy_cache',
+              '.pytest_cache', 'site-packages')
+    # what a bare repo has at the top
+    BARE_ENTRIES = {'HEAD', 'objects', 'refs'}
+    tracer = DISABLED_TRACER
+
+    def __init__(self, clone_dir, index_file, ignore=IGNORE, max_depth=None, workers=8):
+        self.clone_dir = clone_dir
+        self.index_file = index_file
+        self.ignore = list(ignore)
+        self.max_depth = int(max_depth) if max_depth is not None else None
+        self.workers = workers
+        self.repos = {} # repo path -> {'name', 'path', 'gitdir', 'remotes', 'config_mtime'}
+        self.dirs = {} # non-repo directory -> {'mtime', 'subdirs'}
+        self.by_name = {} # repo name -> list of repo paths
+        self.dirty = False
+        self.load()
+
+    def __contains__(self, name):
+        return name in self.by_name
+
+    def __len__(self):
+        return len(self.repos)
+
+    def names(self):
+        """list of repo names"""
+        return [record['name'] for record in self.repos.values()]
+
+    def paths(self):
+        """list of repo paths"""
+        return list(self.repos)
+
+    def load(self):
+        """read index_file; anything unreadable or for another clone_dir means a full scan"""
+        try:
+            with open(self.index_file) as index_file:
+                data = json.load(index_file)
+        except (OSError, ValueError): # missing, or an old plain git_list
+            return
+        if data.get('version') != self.VERSION or data.get('clone_dir') != path.abspath(self.clone_dir):
+            return
+        if data.get('ignore') != self.ignore or data.get('max_depth') != self.max_depth:
+            return # the directories were listed differently
+        self.dirs = data['dirs']
+        self.repos = {}
+        self.by_name = {}
+        for record in data['repos']:
+            self._add_record(record)
+
+    def save(self):
+        """write index_file if anything changed since it was loaded"""
+        if not self.dirty:
+            return
+        data = {'version': self.VERSION,
+                'clone_dir': path.abspath(self.clone_dir),
+                'ignore': self.ignore,
+                'max_depth': self.max_depth,
+                'dirs': self.dirs,
+                'repos': list(self.repos.values())}
+        tmp_file = f"{self.index_file}.tmp"
+        with open(tmp_file, "w") as index_file:
+            json.dump(data, index_file)
+        os.replace(tmp_file, self.index_file)
+        self.dirty = False
+
+    def refresh(self):
+        """bring the index up to date with clone_dir. Returns True if anything changed."""
+        with self.tracer.span('walk', clone_dir=self.clone_dir) as span:
+            changed = self._refresh()
+            span.update(repos=len(self.repos), dirs=len(self.dirs), changed=changed)
+        return changed
+
+    def _refresh(self):
+        old_repos, old_dirs = self.repos, self.dirs
+        repos, dirs = {}, {}
+        subtrees = self._visit(self.clone_dir, 0, old_repos, old_dirs, repos, dirs)
+        if self.workers > 1 and len(subtrees) > 1:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                walks = list(executor.map(lambda subtree: self._walk(subtree, old_repos, old_dirs), subtrees))
+        else:
+            walks = [self._walk(subtree, old_repos, old_dirs) for subtree in subtrees]
+        for subtree_repos, subtree_dirs in walks:
+            repos.update(subtree_repos)
+            dirs.update(subtree_dirs)
+        self.repos, self.dirs, self.by_name = {}, dirs, {}
+        for record in repos.values():
+            self._add_record(record)
+        changed = self.dirs != old_dirs or self.repos != old_repos
+        self.dirty = self.dirty or changed
+        return changed
+
+    def _walk(self, top, old_repos, old_dirs):
+        """the repos and other directories in the subtree top, one level below clone_dir"""
+        repos, dirs = {}, {}
+        stack = [(top, 1)]
+        while stack:
+            root, depth = stack.pop()
+            stack.extend((subdir, depth + 1) for subdir in self._visit(root, depth, old_repos, old_dirs, repos, dirs))
+        return repos, dirs
+
+    def _visit(self, root, depth, old_repos, old_dirs, repos, dirs):
+        """record root in repos or dirs; returns the subdirectories to look into"""
+        try:
+            mtime = os.stat(root).st_mtime_ns
+        except OSError:
+            return []
+        seen = old_dirs.get(root)
+        if seen and seen['mtime'] == mtime: # same entries as last time
+            dirs[root] = seen
+            return seen['subdirs']
+        if root in old_repos and self._config_mtime(old_repos[root]['gitdir']) is not None:
+            repos[root] = self._refresh_record(old_repos[root])
+            return []
+        try:
+            with os.scandir(root) as entries:
+                entries = list(entries)
+        except OSError:
+            return []
+        names = {entry.name for entry in entries}
+        if '.git' in names or self.BARE_ENTRIES <= names:
+            try:
+                repos[root] = self._read_record(root)
+                return []
+            except pygit2.GitError: # a broken .git; look on as if it weren't there
+                pass
+        subdirs = []
+        if self.max_depth is None or depth < self.max_depth:
+            subdirs = [entry.path for entry in entries
+                       if entry.name != '.git' and entry.is_dir(follow_symlinks=False) and not self._ignored(entry)]
+        dirs[root] = {'mtime': mtime, 'subdirs': subdirs}
+        return subdirs
+
+    def _ignored(self, entry):
+        relative_path = None
+        for pattern in self.ignore:
+            if '/' in pattern:
+                if relative_path is None:
+                    relative_path = path.relpath(entry.path, self.clone_dir).replace(path.sep, '/')
+                if fnmatch.fnmatch(relative_path, pattern):
+                    return True
+            elif fnmatch.fnmatch(entry.name, pattern):
+                return True
+        return False
+
+    def add(self, repo_path, repo):
+        """record a pygit2 repo that was just created at repo_path"""
+        self._add_record(self._read_record(repo_path, repo))
+        self.dirty = True
+
+    def update(self, repo):
+        """re-read the remotes of an indexed repo (a pygit2 repo or LocalRepo) after they were
+        changed. Returns its new record, or None if it isn't in the index."""
+        repo_path = getattr(repo, 'workdir_path', None)
+        if repo_path is None:
+            repo_path = (repo.workdir or '').rstrip(path.sep)
+            if repo_path not in self.repos: # indexed under a relative clone_dir
+                repo_path = next((record['path'] for record in self.repos.values()
+                                  if record['gitdir'] == repo.path), None)
+        if repo_path not in self.repos:
+            return None
+        record = self.repos[repo_path] = self._read_record(repo_path, repo)
+        self.dirty = True
+        return record
+
+    def _add_record(self, record):
+        self.repos[record['path']] = record
+        self.by_name.setdefault(record['name'], []).append(record['path'])
+
+    @staticmethod
+    def _config_mtime(gitdir):
+        try:
+            return os.stat(path.join(gitdir, 'config')).st_mtime_ns
+        except OSError:
+            return None
+
+    def _refresh_record(self, record):
+        """re-read remotes only if the repo's config has changed"""
+        if self._config_mtime(record['gitdir']) == record['config_mtime']:
+            return record
+        return self._read_record(record['path'])
+
+    def _read_record(self, repo_path, repo=None):
+        if repo is None:
+            repo = pygit2.Repository(pygit2.discover_repository(repo_path) or repo_path)
+        return {'name': repo_path.rstrip(path.sep).split(path.sep)[-1],
+                'path': repo_path,
+                'gitdir': repo.path,
+                'remotes': {remote.name: remote.url for remote in repo.remotes},
+                'config_mtime': self._config_mtime(repo.path)}
+
+
+class LocalRepo:
+    """A repo from LocalRepoIndex. Its pygit2.Repository is only opened when an attribute
+    other than name, workdir_path or indexed_remotes is used; everything else is passed through."""
+    def __init__(self, local_repos, record):
+        self._local_repos = local_repos
+        self.name = record['name']
+        self.workdir_path = record['path']
+        self.indexed_remotes = record['remotes'] # as of the last index refresh
+
+    def __getattr__(self, attr):
+        return getattr(self.__dict__['_local_repos'].open(self.__dict__['workdir_path']), attr)
+
+    def __repr__(self):
+        return f"LocalRepo({self.workdir_path})"
+
+
+class LocalRepos:
+    """Lazy collection of the repos in a LocalRepoIndex.
+    len(), iteration and lookup by name only use the index. Repositories are
+    opened on first use and at most max_open stay open; the least recently
+    used are freed (pygit2 reopens them transparently if still referenced)."""
+    def __init__(self, index, max_open=64):
+        self.index = index
+        self.max_open = max_open
+        self._open = OrderedDict() # repo path -> pygit2.Repository, least recently used first
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        for record in list(self.index.repos.values()):
+            yield LocalRepo(self, record)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __getitem__(self, key):
+        """repo by position or by name"""
+        if isinstance(key, str):
+            return LocalRepo(self, self.index.repos[self.index.by_name[key][0]])
+        return LocalRepo(self, self.index.repos[self.index.paths()[key]])
+
+    def get(self, name, default=None):
+        """repo by name, or default"""
+        return self[name] if name in self else default
+
+    def open(self, repo_path):
+        """pygit2.Repository for repo_path, opening it if needed"""
+        with self._lock:
+            repo = self._open.get(repo_path)
+            if repo is not None:
+                self._open.move_to_end(repo_path)
+                return repo
+            repo = pygit2.Repository(self.index.repos[repo_path]['gitdir'])
+            self._remember(repo_path, repo)
+            return repo
+
+    def add(self, repo_path, repo):
+        """keep an already open repo, e.g. one that was just cloned"""
+        with self._lock:
+            self._remember(repo_path, repo)
+
+    def _remember(self, repo_path, repo):
+        self._open[repo_path] = repo
+        self._open.move_to_end(repo_path)
+        while len(self._open) > self.max_open:
+            _, oldest = self._open.popitem(last=False)
+            oldest.free()
+
+    def close(self):
+        """free every open repo"""
+        with self._lock:
+            while self._open:
+                _, repo = self._open.popitem()
+                repo.free()
+
+
+# marks the end of the stream between pipeline stages
+PIPELINE_DONE = object()
+
+
+class PipelineItem:
+    """One repo's progress through Githubtool.pipeline: the search result, its ForkHandle,
+    CloneResult and upstream remote, the last stage it reached and any error"""
+    def __init__(self, repo):
+        self.repo = repo
+        self.fork = None
+        self.clone = None
+        self.upstream = None
+        self.stage = 'search'
+        self.error = None
+
+    def __repr__(self):
+        return f"PipelineItem({self.repo.full_name}, stage={self.stage}, error={self.error!r})"
+
+
+class JobJournal:
+    """Append-only record of a batch job's progress, one JSON line per event, so that an
+    interrupted job can be resumed. Each repo, by the full_name it was found under, goes
+    through the stages found, forked, cloned and upstream; the data recorded with them
+    (the repo, the fork, the clone path) is enough to pick up without asking Github again.
+    forking is recorded just before a fork is asked for, so a fork made by a job that was
+    stopped before it got the reply is still known to be the job's; forked is recorded again,
+    with ready set, once the fork has passed a poll.
+    job identifies the batch (e.g. its keywords); resuming another job's journal is an error.
+    Without resume, an existing journal is started afresh."""
+    STAGES = ('found', 'forking', 'forked', 'cloned', 'upstream')
+
+    def __init__(self, journal_file, job=None, resume=False):
+        self.journal_file = journal_file
+        self.job = job
+        self.repos = OrderedDict() # full_name -> {stage: data}
+        self.search_done = False
+        self._lock = threading.Lock()
+        if resume and path.exists(journal_file):
+            self.load()
+            self._file = open(journal_file, 'a')
+        else:
+            self._file = open(journal_file, 'w')
+            self._write({'job': job})
+
+    def load(self):
+        with open(self.journal_file) as journal_file:
+            for line in journal_file:
+                try:
+                    event = json.loads(line)
+                except ValueError: # the last line of a job that was killed mid-write
+                    continue
+                if 'job' in event:
+                    if event['job'] != self.job:
+                        sys.exit(f"{self.journal_file} is the journal of another job: {event['job']}")
+                elif event.get('search_done'):
+                    self.search_done = True
+                else:
+                    self.repos.setdefault(event['repo'], {})[event['stage']] = event.get('data') or {}
+
+    def _write(self, event):
+        self._file.write(json.dumps(event) + '\n')
+        self._file.flush()
+
+    def record(self, full_name, stage, **data):
+        with self._lock:
+            self.repos.setdefault(full_name, {})[stage] = data
+            self._write({'repo': full_name, 'stage': stage, 'data': data})
+
+    def finish_search(self):
+        with self._lock:
+            self.search_done = True
+            self._write({'search_done': True})
+
+    def get(self, full_name, stage):
+        """data recorded for stage of full_name, or None if it isn't done"""
+        return self.repos.get(full_name, {}).get(stage)
+
+    def found(self):
+        """data of every repo found, in the order they were found"""
+        return [stages['found'] for stages in self.repos.values() if 'found' in stages]
+
+    def close(self):
+        self._file.close()
+
+
 class Githubtool:
     """Githubtool class
     """
@@ -62,15 +1024,30 @@ class Githubtool:
                  clone_dir='..',
                  access_token_file='.oAuth',
                  access_token=None,
+                 cache_dir=CACHE_DIR_UNSET,
+                 base_url=None,
+                 mirror_dir=None,
+                 tracer=None,
+                 journal=None,
+                 ignore=(),
+                 max_depth=None,
                  ):
         """ create a new githubtool.
 Arguments:
  is_verbose : if True, print information about activities
  is_test : if True, do not make actual changes
- locals_file : file name of list of repo names under clone_dir
+ locals_file : file name of the index of local repos under clone_dir
  clone_dir : path of local repositories
- access_token_file : file with Github access token
- access_token : Github access token
+ access_token_file : file with Github access token(s), one per line
+ access_token : Github access token, or several separated by commas
+ cache_dir : directory for the on-disk API response cache; None to disable. If it isn't
+             given there is no cache, except that watch keeps one in DEFAULT_CACHE_DIR
+ base_url : Github API URL, e.g. of Github Enterprise or a local stand-in
+ mirror_dir : directory of bare upstream mirrors that forks are cloned from; None to disable
+ tracer : Tracer that times API calls, clones, remote edits and directory walks
+ journal : JobJournal to record progress in, and resume from
+ ignore : globs of directories under clone_dir not to look for repos in, besides LocalRepoIndex.IGNORE
+ max_depth : how many levels below clone_dir to look for repos; None for no limit
 """
         # configs
         self.config = {}
@@ -81,23 +1058,73 @@ Arguments:
         self.is_test = is_test
         self.locals_file = locals_file
         self.clone_dir = clone_dir
+        self.tracer = tracer or DISABLED_TRACER
+        self.journal = journal
+
+        # the Github client is made the first time it's used, see g
+        self.access_token_file = access_token_file
+        self.cache_dir = None if cache_dir is CACHE_DIR_UNSET else cache_dir
+        self._cache_dir_given = cache_dir is not CACHE_DIR_UNSET
+        self.api_url = (base_url or DEFAULT_API_URL).rstrip('/')
+        self._g = None
+        self._g_lock = threading.Lock()
 
-        # initialize Github objects
-        _access_token = self.set_access_token(access_token_file, access_token)
-        self.g = Github(_access_token)
+        # parent full_name -> fork, see fork_index()
+        self.fork_index_ttl = 300
+        self._fork_index = None
+        self._fork_index_time = 0
+        self._fork_index_lock = threading.RLock()
+        self._forks = []
 
-        self.local_repos_list = []
-        self._load_local_repos_list()
-        self.local_repos = []
-        self._load_local_repos()
+        # guards local_index / local_repos when cloning with workers
+        self._local_lock = threading.RLock()
+        self._cloning = set()
+        # clone_dir is only walked once something needs the local repos
+        self.ignore = LocalRepoIndex.IGNORE + tuple(ignore or ())
+        self.max_depth = max_depth
+        self._local_index = None
+        self._local_repos = None
+        self.max_open_repos = 64
+
+        # bare mirrors of upstream repos, see _clone_from_mirror()
+        self.mirror_dir = path.expanduser(mirror_dir) if mirror_dir else None
+        self._mirror_locks = {}
+        self._mirrors_updated = set()
         self.repos = []
         self.forked_repos = []
+        self.unready_forks = []
         self.cloned_repos = []
         self.upstream_remotes = []
 
 
 
 
+    @property
+    def g(self):
+        """the Github client, set up with the access tokens, cache and scheduler the first time it's used"""
+        with self._g_lock:
+            if self._g is None:
+                self._connect()
+            return self._g
+
+    def _connect(self):
+        from github import Github
+        from urllib3 import Retry
+        _access_token = self.set_access_token(self.access_token_file, self.config['-t'])
+        self.cache = HTTPCache(path.expanduser(self.cache_dir)) if self.cache_dir else None
+        # the secondary limits we pace for are github.com's; Enterprise servers set their own
+        self.scheduler = RateLimitScheduler(self.access_tokens, is_verbose=self.is_verbose,
+                                            paced=self.api_url == DEFAULT_API_URL)
+        self.transport = GithubTransport(self.cache, self.scheduler)
+        self.scheduler.tracer = self.transport.tracer = self.tracer
+        self.transport.install()
+        # rate limits are handled by the scheduler, so only retry server errors here
+        retry = Retry(total=3, backoff_factor=1, status_forcelist=[500, 502, 503, 504],
+                      respect_retry_after_header=False)
+        # pacing is also the scheduler's job; PyGithub's own spacing would serialize worker threads
+        self._g = Github(_access_token, base_url=self.api_url, retry=retry,
+                         seconds_between_requests=None, seconds_between_writes=None)
+
     @staticmethod
     def load_access_token(fname):
         """given a file name / path fname, return the string stored in it.
@@ -106,23 +1133,32 @@ Arguments:
         token = f.read()
         return token.rstrip()
 
+    @staticmethod
+    def load_access_tokens(fname):
+        """given a file name / path fname, return the list of tokens in it, one per line"""
+        with open(fname, "r") as f:
+            return [line.strip() for line in f if line.strip()]
+
     def set_access_token(self, access_token_file, access_token):
         """first looks to set auth token passed directly from config['-t']
-        then looks for auth token stored in a file from config['-f']"""
+        then looks for auth token stored in a file from config['-f'].
+        Either can hold several tokens (comma-separated, or one per line in the file);
+        they are pooled in self.access_tokens and the first one is returned."""
 
-        token = None
+        tokens = []
 
     # if -t flag set, takes precedence. Probably should validate.
 
         if access_token:
-            token = access_token
+            tokens = [token.strip() for token in access_token.split(',') if token.strip()]
         else:
             if path.exists(access_token_file):
-                token = self.load_access_token(access_token_file)
+                tokens = self.load_access_tokens(access_token_file)
 
-        if not token:
+        if not tokens:
             sys.exit([f"No {access_token_file} file found or -t=ACCESS_TOKEN specified."])
-        return token
+        self.access_tokens = tokens
+        return tokens[0]
 
     @staticmethod
     def _is_iterable(obj):
@@ -134,24 +1170,47 @@ Arguments:
         else:
             return True
 
-    def search_github_repos(self, keywords, user=None, max_match=None):
+    @classmethod
+    def _local_repo_list(cls, repos):
+        """repos as a list, if it's a single local repo or CloneResult. A pygit2.Repository
+        iterates over its object ids, so being iterable doesn't make it a list of repos."""
+        if isinstance(repos, (pygit2.Repository, LocalRepo, CloneResult)) or not cls._is_iterable(repos):
+            return [repos]
+        return repos
+
+    def search_github_repos(self, keywords, user=None, max_match=None, shard_by=None, workers=4):
         """
-        given keywords (either list or single string) and config hash, user can be specified as well"""
+        given keywords (either list or single string) and config hash, user can be specified as well.
+        With shard_by ('created' or 'pushed'), the search is split by those dates to get past
+        Github's 1,000-result cap; see iter_sharded_search.
+        With a journal whose search finished, the repos found then are returned without searching."""
 
-        if type(keywords) is not list: keywords = [keywords] # not the most pythonic but strings are iterable
-        q = ' '.join(keywords) # the space gets converted to a +
-        if user:
-            q = f'{q} user:{user}'
-        repos = self.g.search_repositories(query=q, sort='updated', order='desc')
+        if self.journal and self.journal.search_done:
+            repos = self._resumed_repos(max_match)
+            if self.is_test or self.is_verbose:
+                print(f'Resuming with {len(repos)} repo(s) found before')
+        else:
+            query = self._search_query(keywords, user)
+            n = int(max_match) if max_match else None # I should be validating this argument
+            if shard_by:
+                repos = list(itertools.islice(self.iter_sharded_search(query, shard_by, workers), n))
+                if self.is_test or self.is_verbose:
+                    print(f'Found {len(repos)} repo(s)')
+            else:
+                pages = self._search_pages(query)
+                total_count, repos = next(pages, (0, []))
 
-        if self.is_test or self.is_verbose:
-            print(f'Found {repos.totalCount} repo(s)')
-        if max_match: # I should be validating this argument
-            n = int(max_match)
-            if n < repos.totalCount:
-                repos = list(repos[0:n-1])
                 if self.is_test or self.is_verbose:
+                    print(f'Found {total_count} repo(s)')
+                if n is not None and n < total_count and (self.is_test or self.is_verbose):
                     print(f'Limiting to first {n} repos.')
+                # only the pages needed for the first n repos are fetched
+                later_pages = itertools.chain.from_iterable(page for _, page in pages)
+                repos = list(itertools.islice(itertools.chain(repos, later_pages), n))
+            if self.journal:
+                for repo in repos:
+                    self._journal_found(repo)
+                self.journal.finish_search()
 
         if self.is_verbose:
             for repo in repos:
@@ -164,30 +1223,199 @@ Arguments:
         self.repos = repos
         return repos
 
+    def iter_github_repos(self, keywords, user=None, max_match=None, shard_by=None, workers=4):
+        """Generator version of search_github_repos: yields matching repos as each
+        page of results arrives, without loading the whole result set"""
+        if self.journal and self.journal.search_done:
+            yield from self._resumed_repos(max_match)
+            return
+        query = self._search_query(keywords, user)
+        if shard_by:
+            repos = self.iter_sharded_search(query, shard_by, workers)
+        else:
+            pages = self._search_pages(query)
+            repos = itertools.chain.from_iterable(page for _, page in pages)
+        if max_match:
+            repos = itertools.islice(repos, int(max_match))
+        for repo in repos:
+            if self.is_verbose:
+                print(repo.clone_url)
+            self._journal_found(repo)
+            yield repo
+        if self.journal:
+            self.journal.finish_search()
+
+    def _search_pages(self, query, per_page=100):
+        """Generator: (total_count, [RepoRecord]) for each page of the search for query, most
+        recently updated first. Pages are requested one at a time as they're needed, and
+        no PyGithub Repository objects are made for the results."""
+        requester = self.g.requester
+        url = '/search/repositories'
+        parameters = {'q': query, 'sort': 'updated', 'order': 'desc', 'per_page': per_page}
+        while url:
+            headers, data = requester.requestJsonAndCheck('GET', url, parameters=parameters)
+            yield data['total_count'], [RepoRecord.from_raw(item) for item in data['items']]
+            # the next page's url has the query in it
+            url, parameters = self._next_page_url(headers), None
+
+    def iter_sharded_search(self, query, shard_by='created', workers=4, per_page=100):
+        """Generator: every repo matching query, past the SEARCH_CAP results Github gives for
+        one search. The query is limited to ranges of shard_by ('created' or 'pushed') dates,
+        starting with all of them; a range matching more than SEARCH_CAP repos is split and
+        each part searched again, until every shard is under the cap. Shards and their pages
+        are fetched on up to workers threads, and repos are yielded as each page arrives,
+        once per full_name (a repo pushed to mid-search can turn up in two shards)."""
+        if shard_by not in ('created', 'pushed'):
+            raise ValueError(f"can't shard a search by {shard_by}, only by created or pushed")
+        seen = set()
+        with ThreadPoolExecutor(max_workers=int(workers)) as executor:
+            def submit(start, end, page):
+                future = executor.submit(self._search_page, self._shard_query(query, shard_by, start, end),
+                                         page, per_page)
+                pending[future] = (start, end, page)
+            pending = {}
+            submit(SEARCH_EPOCH, int(time.time()) + 86400, 1)
+            try:
+                while pending:
+                    done, _ = wait_futures(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        start, end, page = pending.pop(future)
+                        total_count, repos = future.result()
+                        if page == 1 and total_count > SEARCH_CAP and end > start:
+                            parts = min(-(-total_count // SEARCH_CAP) + 1, end - start + 1)
+                            if self.is_verbose:
+                                print(f"Splitting {total_count} repo(s) {self._shard_range(start, end)} into {parts}")
+                            bounds = [start + (end - start + 1) * n // parts for n in range(parts + 1)]
+                            for part_start, part_end in zip(bounds, bounds[1:]):
+                                submit(part_start, part_end - 1, 1)
+                        elif page == 1:
+                            if total_count > SEARCH_CAP:
+                                print(f"Only the first {SEARCH_CAP} of {total_count} repos {shard_by} "
+                                      f"at {self._shard_range(start, end)} can be found.")
+                            for later_page in range(2, -(-min(total_count, SEARCH_CAP) // per_page) + 1):
+                                submit(start, end, later_page)
+                        for repo in repos:
+                            if repo.full_name not in seen:
+                                seen.add(repo.full_name)
+                                yield repo
+            finally: # e.g. the caller has all the repos it wants
+                for future in pending:
+                    future.cancel()
+
+    def _search_page(self, query, page=1, per_page=100):
+        """(total_count, [RepoRecord]) for one page of the search for query"""
+        parameters = {'q': query, 'sort': 'updated', 'order': 'desc', 'per_page': per_page, 'page': page}
+        _, data = self.g.requester.requestJsonAndCheck('GET', '/search/repositories', parameters=parameters)
+        return data['total_count'], [RepoRecord.from_raw(item) for item in data['items']]
+
+    @classmethod
+    def _shard_query(cls, query, shard_by, start, end):
+        """query limited to repos whose shard_by date is from start to end (epoch seconds, inclusive)"""
+        return f"{query} {shard_by}:{cls._shard_range(start, end)}"
+
+    @staticmethod
+    def _shard_range(start, end):
+        return '..'.join(time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(t)) for t in (start, end))
+
+    @staticmethod
+    def _next_page_url(headers):
+        """the url of the next page from a paginated response's Link header, or None"""
+        link = next((value for key, value in headers.items() if key.lower() == 'link'), '')
+        match = re.search(r'<([^>]+)>;\s*rel="next"', link)
+        return match.group(1) if match else None
+
+    @staticmethod
+    def _search_query(keywords, user=None):
+        """search query for keywords (either list or single string), optionally limited to user"""
+        if type(keywords) is not list: keywords = [keywords] # not the most pythonic but strings are iterable
+        q = ' '.join(keywords) # the space gets converted to a +
+        if user:
+            q = f'{q} user:{user}'
+        return q
+
     # Fork them
 
     def my_forked_repos(self):
         """Return list of forked repos for user associated with g"""
-        me = self.g.get_user()
-        my_repos = me.get_repos()
-        self.forked_repos = [repo for repo in my_repos if repo.fork]
+        self.fork_index(refresh=True)
+        self.forked_repos = list(self._forks)
         return self.forked_repos
 
-    def find_fork(self, repo):
-        """For a given repo, check that github_user has a repo of the same name that is its fork.
-    If fork exists, return the fork. Else return false.
-    This is a moderately accurate check. The correct way is to load all the user's repos and check through the parents."""
+    def fork_index(self, refresh=False):
+        """Return dict of parent full_name -> fork for user associated with g.
+        Built in one paginated pass over the user's forks and reused for
+        fork_index_ttl seconds, or until invalidate_fork_index() is called."""
+        with self._fork_index_lock:
+            expired = time.monotonic() - self._fork_index_time > self.fork_index_ttl
+            if refresh or self._fork_index is None or expired:
+                self._load_fork_index()
+            return self._fork_index
 
-        me = self.g.get_user()
-        try:
-            my_repo = self.g.get_repo(f"{me.login}/{repo.name}")
-        except:
-            return False
-        else:
-            if (my_repo.fork) and (my_repo.parent.full_name == repo.full_name):
-                return my_repo
-            else:
-                return False
+    def invalidate_fork_index(self):
+        """Force the next fork_index() call to reload from Github"""
+        with self._fork_index_lock:
+            self._fork_index = None
+
+    def _load_fork_index(self):
+        """load all the user's forks with a paginated GraphQL query"""
+        index = {}
+        forks = []
+        cursor = None
+        while True:
+            _, data = self.g.requester.graphql_query(FORK_INDEX_QUERY, {'cursor': cursor})
+            repositories = data['data']['viewer']['repositories']
+            for node in repositories['nodes']:
+                fork = self._repo_from_graphql(node)
+                forks.append(fork)
+                if node['parent']: # parent can be gone if it was deleted
+                    index[node['parent']['nameWithOwner']] = fork
+            if not repositories['pageInfo']['hasNextPage']:
+                break
+            cursor = repositories['pageInfo']['endCursor']
+        if self.is_verbose:
+            print(f"Found {len(forks)} fork(s) for {data['data']['viewer']['login']}")
+        self._forks = forks
+        self._fork_index = index
+        self._fork_index_time = time.monotonic()
+
+    def _raw_repo_from_graphql(self, node):
+        """REST-shaped dict for a GraphQL repository node"""
+        owner = node['nameWithOwner'].split('/')[0]
+        raw = {
+            'name': node['name'],
+            'full_name': node['nameWithOwner'],
+            'owner': {'login': owner},
+            'url': f"{self.api_url}/repos/{node['nameWithOwner']}",
+            'html_url': node['url'],
+            'clone_url': node['url'] + '.git',
+            'git_url': 'git://' + node['url'].split('://', 1)[-1] + '.git',
+            'ssh_url': node.get('sshUrl'),
+            'fork': bool(node.get('parent')),
+            'default_branch': (node.get('defaultBranchRef') or {}).get('name'),
+        }
+        if node.get('parent'):
+            raw['parent'] = self._raw_repo_from_graphql(node['parent'])
+        return raw
+
+    def _repo_from_graphql(self, node):
+        """Repository for a GraphQL repository node, without a REST call"""
+        return self._repo_from_raw(self._raw_repo_from_graphql(node))
+
+    def _repo_from_raw(self, raw):
+        """Repository for a dict of REST fields, without a REST call"""
+        from github.Repository import Repository
+        return self.g.create_from_raw_data(Repository, raw)
+
+    def _repository(self, repo):
+        """Repository for repo, which may be a RepoRecord, without a REST call"""
+        if not isinstance(repo, RepoRecord):
+            return repo
+        return self._repo_from_raw(dict(repo.raw(), url=f"{self.api_url}/repos/{repo.full_name}"))
+
+    def find_fork(self, repo):
+        """For a given repo, return github_user's fork of it, else return False.
+    Looks the repo up by full_name in fork_index(), so renamed forks are found too."""
+        return self.fork_index().get(repo.full_name, False)
 
     # AuthenticatedUser.create_fork(repo)
     # Calls:    POST /repos/:owner/:repo/forks
@@ -195,30 +1423,142 @@ Arguments:
     # Return type:    github.Repository.Repository
 
     def fork_repos(self, repos, include_old=False):
-        """For list of repos, fork into github_user's account"""
+        """For list of repos, fork into github_user's account.
+        Returns a ForkHandle for each fork; pass them to wait_for_forks to
+        find out when Github has finished creating them."""
     # make sure repos is iterable
         if not self._is_iterable(repos): repos = [repos]
-        me = self.g.get_user()
         forked_repos = []
-        msg_prefix = 'TEST: ' if self.is_test else ''
         for repo in repos:
-            if self.is_test or self.is_verbose:
-                print(f"{msg_prefix}Forking {repo.clone_url}...")
-            forked_repo = self.find_fork(repo)
-            if forked_repo:
-                if self.is_test or self.is_verbose:
-                    print(f"{repo.clone_url} already forked.")
-                if include_old:
-                    forked_repos.append(forked_repo)
-            else:
-                if not self.is_test:
-                    forked_repo = me.create_fork(repo)
-                    forked_repos.append(forked_repo)
-                if self.is_verbose:
-                    print(f"Done.")
+            handle = self._fork_repo(repo, include_old)
+            if handle:
+                forked_repos.append(handle)
         self.forked_repos = forked_repos
         return forked_repos
 
+    def _fork_repo(self, repo, include_old=False, create=True):
+        """Fork a single repo. Returns a ForkHandle, or None if there is nothing to pass on:
+        the repo was already forked and include_old is False, or it isn't forked and
+        create is False or we're in test mode."""
+        msg_prefix = 'TEST: ' if self.is_test else ''
+        handle = self._resumed_fork(repo)
+        if handle:
+            return handle
+        if (self.is_test or self.is_verbose) and create:
+            print(f"{msg_prefix}Forking {repo.clone_url}...")
+        forked_repo = self.find_fork(repo)
+        if forked_repo and self.journal and self.journal.get(repo.full_name, 'forking') is not None:
+            # this job asked for the fork but was stopped before it was journaled
+            return self._journal_fork(ForkHandle(forked_repo, repo, created=True))
+        if forked_repo:
+            if (self.is_test or self.is_verbose) and create:
+                print(f"{repo.clone_url} already forked.")
+            return self._journal_fork(ForkHandle(forked_repo, repo)) if include_old or not create else None
+        if not create or self.is_test:
+            return None
+        if self.journal:
+            self.journal.record(repo.full_name, 'forking')
+        forked_repo = self.g.get_user().create_fork(self._repository(repo))
+        with self._fork_index_lock:
+            if self._fork_index is not None:
+                self._fork_index[repo.full_name] = forked_repo
+                self._forks.append(forked_repo)
+        if self.is_verbose:
+            print(f"Done.")
+        return self._journal_fork(ForkHandle(forked_repo, repo, created=True))
+
+    def fork_is_ready(self, handle):
+        """Poll Github once for a ForkHandle. The fork is ready when its default branch exists."""
+        if handle.ready:
+            return True
+        from github import GithubException
+        handle.polls += 1
+        try:
+            handle.repo.get_branch(handle.repo.default_branch)
+        except GithubException:
+            return False
+        handle.ready = True
+        if handle.source:
+            self._journal_fork(handle) # so a resumed job needn't poll it again
+        return True
+
+    def _wait_for_fork(self, handle, timeout=120, delay=0.5, max_delay=16):
+        """Block until a single fork is ready, polling with exponential backoff. Returns True if ready."""
+        deadline = time.monotonic() + float(timeout)
+        while not self.fork_is_ready(handle):
+            if time.monotonic() >= deadline:
+                print(f"Fork {handle.full_name} not ready after {timeout} seconds.")
+                return False
+            time.sleep(min(delay, max(0, deadline - time.monotonic())))
+            delay = min(delay * 2, max_delay)
+        return True
+
+    def wait_for_forks(self, handles, timeout=120, workers=8, delay=0.5, max_delay=16):
+        """Generator: poll ForkHandles concurrently, yielding each one as soon as its fork is ready.
+        Each handle is polled with exponential backoff from delay up to max_delay seconds.
+        Handles still not ready after timeout seconds are left in self.unready_forks."""
+        if not self._is_iterable(handles): handles = [handles]
+        events = queue.Queue()
+        for handle in handles:
+            events.put(('add', handle if isinstance(handle, ForkHandle) else ForkHandle(handle)))
+        events.put(('closed', None))
+        self.unready_forks = []
+        for handle, ready in self._poll_forks(events, timeout, workers, delay, max_delay):
+            if isinstance(ready, Exception):
+                raise ready
+            if ready:
+                yield handle
+            else:
+                self.unready_forks.append(handle)
+
+    def _poll_forks(self, events, timeout=120, workers=8, delay=0.5, max_delay=16):
+        """Generator behind wait_for_forks and the pipeline's fork poller. Takes ('add', handle)
+        events from the events queue until ('closed', None), and polls the handles on up to
+        workers threads, each with exponential backoff from delay up to max_delay seconds.
+        Yields (handle, True) as soon as a fork is ready, (handle, False) once it has been
+        polled for timeout seconds, and (handle, error) if polling raised. Finished polls come
+        back through events too, so handles are taken while others are being polled."""
+        pending = [] # heap of (next poll time, order, handle, backoff, deadline)
+        order = itertools.count()
+        polling = 0
+        closed = False
+        with ThreadPoolExecutor(max_workers=int(workers)) as executor:
+            while not closed or pending or polling:
+                now = time.monotonic()
+                while pending and pending[0][0] <= now and polling < int(workers):
+                    entry = heapq.heappop(pending)
+                    future = executor.submit(self.fork_is_ready, entry[2])
+                    future.add_done_callback(lambda future, entry=entry: events.put(('polled', (future, entry))))
+                    polling += 1
+                next_poll = max(0, pending[0][0] - now) if pending and polling < int(workers) else None
+                try:
+                    event, value = events.get(timeout=next_poll)
+                except queue.Empty:
+                    continue
+                if event == 'closed':
+                    closed = True
+                elif event == 'add':
+                    if value.ready:
+                        yield value, True
+                    else:
+                        now = time.monotonic()
+                        heapq.heappush(pending, (now + delay, next(order), value, delay, now + float(timeout)))
+                else:
+                    polling -= 1
+                    future, (_, n, handle, backoff, deadline) = value
+                    if future.exception():
+                        yield handle, future.exception()
+                    elif future.result():
+                        if self.is_verbose:
+                            print(f"Fork {handle.full_name} ready after {handle.polls} poll(s).")
+                        yield handle, True
+                    elif time.monotonic() >= deadline:
+                        print(f"Fork {handle.full_name} not ready after {timeout} seconds.")
+                        yield handle, False
+                    else: # last poll lands on the deadline
+                        next_poll = min(time.monotonic() + backoff, deadline)
+                        heapq.heappush(pending, (next_poll, n, handle, min(backoff * 2, max_delay), deadline))
+
     @staticmethod
     def dir_is_repo(gitdir):
         """Check if dir is a git repository."""
@@ -233,33 +1573,61 @@ Arguments:
 
     # working_dir better not already be a git repository!!
 
+    @property
+    def local_index(self):
+        """LocalRepoIndex of clone_dir, brought up to date the first time it's used"""
+        with self._local_lock:
+            if self._local_index is None:
+                self._local_index = LocalRepoIndex(self.clone_dir, self.locals_file, self.ignore, self.max_depth)
+                self._local_index.tracer = self.tracer
+                self._load_local_repos_list()
+            return self._local_index
+
+    @property
+    def local_repos(self):
+        """lazy collection of the repos in local_index"""
+        with self._local_lock:
+            if self._local_repos is None:
+                self._load_local_repos()
+            return self._local_repos
+
     def _load_local_repos(self):
-        """set self.local_repos from traverse of self.clone_dir"""
-        self.local_repos = []
-        for root, dirs, files in os.walk(self.clone_dir): # for every dir under starting directory
-            if self.dir_is_repo(root):
-                self.local_repos.append(self.local_repo_from_repo_path(root))
-                dirs[:] = [] # don't descend into repo
+        """set self.local_repos to a lazy collection of the repos in self.local_index"""
+        self._local_repos = LocalRepos(self.local_index, self.max_open_repos)
 
     def _load_local_repos_list(self):
-        """Load list of local repos (name only). Default location is git_list"""
-        locals_file = open(self.locals_file, "w")
-        for root, dirs, files in os.walk(self.clone_dir): # for every dir under starting directory
-            if self.dir_is_repo(root):
-                locals_file.write(root.split(path.sep)[-1] + "\n")
-                dirs[:] = [] # don't descend into repo
-        locals_file.close()
-        self.local_repos_list = [repo.rstrip('\n') for repo in open(self.locals_file)]
+        """Bring the local repo index up to date with clone_dir and save it. Default location is git_list"""
+        self.local_index.refresh()
+        self.local_index.save()
+
+    @property
+    def local_repos_list(self):
+        """names of local repos"""
+        return self.local_index.names()
 
     def local_repo_exists(self, repo_name):
-        """Return true if repo_name is found in local repos list"""
-        if not self.local_repos_list:
-            self._load_local_repos_list()
-        return repo_name in self.local_repos_list
+        """Return true if repo_name is found in local repos index"""
+        return repo_name in self.local_index
 
-    def set_origin(self, repo, origin_repo=None):
+    def set_origin(self, repo, origin_repo=None, offline=False):
         """make sure remote origin set to clone_url.
-        If origin_repo not specified, will look for it in repo.remotes['origin']"""
+        If origin_repo not specified, will look for it in repo.remotes['origin'].
+        If offline, clone_url is worked out from the origin url without asking Github."""
+        if offline and not origin_repo:
+            repo_path = getattr(repo, 'workdir_path', None) or repo.path
+            origin_url = self._origin_url(repo)
+            clone_url = self._github_clone_url(origin_url) if origin_url else None
+            if not clone_url:
+                if self.is_test or self.is_verbose:
+                    print(f"{repo_path} does not have a Github origin remote.")
+            elif giturlparse.parse(origin_url).protocol == 'git':
+                if self.is_test or self.is_verbose:
+                    print(f"{'TEST: ' if self.is_test else ''}Setting origin of {repo_path} to {clone_url}")
+                if not self.is_test:
+                    self._set_remote_url(repo, 'origin', clone_url)
+            elif self.is_test or self.is_verbose:
+                print(f"Origin already properly set to {origin_url}.")
+            return
         if not origin_repo:
             try:
                 repo.remotes['origin'] # check if remote origin exists
@@ -270,55 +1638,262 @@ Arguments:
                 if self.is_test or self.is_verbose:
                     print(f"Fetching {repo.remotes['origin'].url}...")
                 origin_repo = self.get_github_repo_from_url(repo.remotes['origin'].url)
-        if ('origin' not in repo.remotes) or (repo.remotes['origin'].url == repo.git_url):
+        if ('origin' not in repo.remotes) or (repo.remotes['origin'].url == origin_repo.git_url):
             if not self.is_test:
-                repo.remotes.set_url('origin', origin_repo.clone_url)
+                self._set_remote_url(repo, 'origin', origin_repo.clone_url)
         elif self.is_test or self.is_verbose:
             print(f"Origin already properly set to {repo.remotes['origin'].url}.")
 
+    def _set_remote_url(self, repo, name, url):
+        with self.tracer.span('remote', name=name, url=url):
+            repo.remotes.set_url(name, url)
+        self._reindex_remotes(repo)
+
+    def _reindex_remotes(self, repo):
+        """bring repo's remotes in the local index up to date after one was added or changed"""
+        if self._local_index is None:
+            return
+        with self._local_lock:
+            record = self._local_index.update(repo)
+        if record and isinstance(repo, LocalRepo):
+            repo.indexed_remotes = record['remotes']
+
+    @staticmethod
+    def _origin_url(repo):
+        """url of repo's origin remote, from the local index when we have it; None if there isn't one"""
+        remotes = getattr(repo, 'indexed_remotes', None)
+        if remotes is not None:
+            return remotes.get('origin')
+        try:
+            return repo.remotes['origin'].url
+        except KeyError:
+            return None
+
+    def set_origins(self, repos, offline=True, workers=8):
+        """set_origin for many local repos, on up to workers threads.
+        offline works every clone_url out from the origin url, with no API calls. Otherwise
+        the origins are looked up in de-duplicated, batched queries; that also catches repos
+        renamed or transferred since they were cloned, whose origin is then pointed at the new name."""
+        if not self._is_iterable(repos): repos = [repos]
+        origins = {}
+        for repo in repos:
+            origin_url = self._origin_url(repo)
+            if origin_url and self._github_clone_url(origin_url):
+                origins[repo] = origin_url
+            elif self.is_test or self.is_verbose:
+                print(f"{repo.path} doesn't have a Github origin.")
+        origin_repos = {}
+        if not offline:
+            origin_repos = self.resolve_repos([self.full_name_from_url(url) for url in origins.values()],
+                                              workers=workers)
+
+        def fix(repo):
+            try:
+                if offline:
+                    return self.set_origin(repo, offline=True)
+                full_name = self.full_name_from_url(origins[repo])
+                origin_repo = origin_repos.get(full_name)
+                if not origin_repo:
+                    if self.is_test or self.is_verbose:
+                        print(f"Origin of {repo.path} not found on Github.")
+                elif origin_repo.full_name.lower() != full_name.lower(): # renamed or transferred
+                    if self.is_test or self.is_verbose:
+                        print(f"{full_name} is now {origin_repo.full_name}, updating origin of {repo.path}")
+                    if not self.is_test:
+                        self._set_remote_url(repo, 'origin', origin_repo.clone_url)
+                else:
+                    self.set_origin(repo, origin_repo)
+            except Exception as err:
+                print(f"Could not fix origin of {repo.path}: {err}")
+
+        with ThreadPoolExecutor(max_workers=int(workers)) as executor:
+            list(executor.map(fix, origins))
+
     @staticmethod
     def local_repo_from_repo_path(repo_path):
         """return pygit2 repo object from a repo_path"""
         return pygit2.Repository(pygit2.discover_repository(repo_path))
 
-    def clone_repos(self, repos, clone=True):
+    def clone_repos(self, repos, clone=True, workers=1, **clone_options):
         """For list of repos, clone into local directory set by config['--dir']
-        If clone=False: only set origin"""
+        If clone=False: only set origin
+        If workers > 1, clone on a pool of that many threads. A failed clone
+        does not stop the rest of the batch.
+        clone_options limit what is downloaded:
+         depth : only fetch the last depth commits (0 for full history)
+         single_branch : only fetch the repo's default branch
+         blob_filter : partial clone filter such as 'blob:none' (uses the git command line)
+        Use deepen() to fetch more history later.
+        Returns a CloneResult(repo, status, local_repo, error) for each repo."""
     # make sure repos is iterable
         if not self._is_iterable(repos): repos = [repos]
-        cloned_repos = []
         working_dir = self.config['--dir']
+        if self.dir_is_repo(working_dir):
+            sys.exit(f"A repository already exists in {working_dir}")
+        workers = int(workers or 1)
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(self._clone_repo, repo, working_dir, clone, **clone_options)
+                           for repo in repos]
+                results = [future.result() for future in futures]
+        else:
+            results = [self._clone_repo(repo, working_dir, clone, **clone_options) for repo in repos]
+        self.local_index.save()
+        self.cloned_repos = [result.local_repo for result in results if result.local_repo]
+        if self.is_test or self.is_verbose:
+            counts = Counter(result.status for result in results)
+            print(', '.join(f"{n} {status}" for status, n in counts.items()) or "Nothing to clone.")
+        for result in results:
+            if result.status == 'failed':
+                print(f"Failed to clone {result.repo.git_url}: {result.error}")
+        return results
+
+    def _clone_repo(self, repo, working_dir, clone=True, **clone_options):
+        """Clone a single repo into working_dir. Safe to call from worker threads.
+        Returns a CloneResult; exceptions are caught and reported as 'failed'."""
+        clone_path = working_dir + "/" + repo.name
         msg_prefix = 'TEST: ' if self.is_test else ''
-        for repo in repos:
-            clone_path = working_dir + "/" + repo.name
-            if self.is_test or self.is_verbose:
-                print(f"{msg_prefix}Cloning {repo.git_url} into {clone_path} ...")
-            if self.dir_is_repo(working_dir):
-                sys.exit(f"A repository already exists in {working_dir}")
+        # forks are journaled under the repo they were forked from
+        key = repo.source.full_name if self.journal and isinstance(repo, ForkHandle) and repo.source else None
+        cloned = self.journal.get(key, 'cloned') if key else None
+        if key and not cloned and self.dir_is_repo(clone_path): # the run was stopped before journaling it
+            cloned = {'path': clone_path}
+            self.journal.record(key, 'cloned', path=clone_path)
+        if cloned and self.dir_is_repo(cloned['path']):
+            return CloneResult(repo, 'existing', self.local_repo_from_repo_path(cloned['path']), None)
+        if self.is_test or self.is_verbose:
+            print(f"{msg_prefix}Cloning {repo.git_url} into {clone_path} ...")
 
-    # check if the working dir includes the repo somewhere
+    # check if the working dir includes the repo somewhere, and claim the name so
+    # that two workers never clone into the same path
 
-            if self.local_repo_exists(repo.name):
+        with self._local_lock:
+            if self.local_repo_exists(repo.name) or repo.name in self._cloning:
                 if self.is_test or self.is_verbose:
                     print(f"Repository {repo.name} already cloned somewhere in {working_dir}")
-                continue
+                return CloneResult(repo, 'skipped', None, None)
+            self._cloning.add(repo.name)
+        try:
             if self.dir_is_repo(clone_path):
                 if self.is_test or self.is_verbose:
                     print(f"Repository {repo.name} already exists in {working_dir}")
                 cloned_repo = self.local_repo_from_repo_path(clone_path)
                 # if the repo's origin remote doesn't exist or is set to the git_url, fix it to the clone_url
-                self.set_origin(repo, cloned_repo)
-            elif not self.is_test:
-                cloned_repo = pygit2.clone_repository(repo.git_url, clone_path)
-                self.set_origin(repo, cloned_repo)
-                self.local_repos_list.append(repo.name)
-                self.local_repos.append(cloned_repo)
-            if not self.is_test:
-                cloned_repos.append(cloned_repo)
+                self.set_origin(cloned_repo, repo)
+                status = 'existing'
+            elif clone and not self.is_test:
+                branch = getattr(repo, 'default_branch', None)
+                upstream = self._upstream_of(repo) if self.mirror_dir else None
+                with self.tracer.span('clone', url=repo.git_url, mirror=bool(upstream)):
+                    if upstream:
+                        cloned_repo = self._clone_from_mirror(repo, upstream, clone_path, branch)
+                    else:
+                        cloned_repo = self._clone(repo.git_url, clone_path, branch=branch, **clone_options)
+                self.set_origin(cloned_repo, repo)
+                with self._local_lock:
+                    self.local_index.add(clone_path, cloned_repo)
+                    self.local_repos.add(clone_path, cloned_repo)
+                status = 'cloned'
+            else:
+                return CloneResult(repo, 'skipped', None, None)
+        except Exception as err:
+            return CloneResult(repo, 'failed', None, err)
+        finally:
+            with self._local_lock:
+                self._cloning.discard(repo.name)
+        if key:
+            self.journal.record(key, 'cloned', path=clone_path)
+        if self.is_verbose:
+            print(f"Done.")
+        return CloneResult(repo, status, cloned_repo, None)
+
+    @staticmethod
+    def _clone(url, clone_path, depth=0, branch=None, single_branch=False, blob_filter=None):
+        """clone url into clone_path, fetching only what the options ask for.
+        libgit2 can't make partial clones, so a blob_filter clone runs git clone instead."""
+        depth = int(depth or 0)
+        if blob_filter:
+            command = ['git', 'clone', '--quiet', f'--filter={blob_filter}']
+            if depth:
+                command += ['--depth', str(depth)]
+            if single_branch:
+                command.append('--single-branch')
+            try:
+                subprocess.run(command + ['--', url, clone_path], check=True, capture_output=True, text=True)
+            except subprocess.CalledProcessError as err:
+                raise pygit2.GitError(err.stderr.strip()) from err
+            return pygit2.Repository(clone_path)
+        def single_branch_remote(repo, name, remote_url): # pygit2 passes name and url as bytes
+            name, remote_url = name.decode(), remote_url.decode()
+            # without the repo's default branch, ask the remote which branch its HEAD is
+            fetch_branch = branch or next((head.symref_target[len('refs/heads/'):]
+                                           for head in repo.remotes.create_anonymous(remote_url).list_heads()
+                                           if head.name == 'HEAD' and head.symref_target), None)
+            if not fetch_branch:
+                print(f"Can't tell the default branch of {url}, cloning all its branches.")
+                return repo.remotes.create(name, remote_url)
+            return repo.remotes.create(name, remote_url, f"+refs/heads/{fetch_branch}:refs/remotes/{name}/{fetch_branch}")
+        return pygit2.clone_repository(url, clone_path, remote=single_branch_remote if single_branch else None,
+                                       depth=depth, checkout_branch=branch if single_branch else None)
+
+    @staticmethod
+    def _upstream_of(repo):
+        """the repo a fork was made from, if known: a ForkHandle's source or a Repository's parent"""
+        return getattr(repo, 'source', None) or getattr(repo, 'parent', None)
+
+    def update_mirror(self, upstream):
+        """Create or fetch the bare mirror of upstream under mirror_dir; return its path.
+        A mirror is fetched at most once per Githubtool."""
+        mirror_path = path.join(self.mirror_dir, upstream.full_name + '.git')
+        with self._local_lock:
+            lock = self._mirror_locks.setdefault(upstream.full_name, threading.Lock())
+        with lock:
+            if upstream.full_name in self._mirrors_updated:
+                return mirror_path
             if self.is_verbose:
-                print(f"Done.")
-        self.cloned_repos = cloned_repos
-        return cloned_repos
+                print(f"Updating mirror of {upstream.full_name} in {mirror_path} ...")
+            with self.tracer.span('mirror', url=upstream.git_url):
+                if path.exists(mirror_path):
+                    pygit2.Repository(mirror_path).remotes['origin'].fetch(prune=pygit2.enums.FetchPrune.PRUNE)
+                else:
+                    def remote(repo, name, url): # mirror the branches as they are upstream
+                        return repo.remotes.create(name.decode(), url, "+refs/heads/*:refs/heads/*")
+                    pygit2.clone_repository(upstream.git_url, mirror_path, bare=True, remote=remote)
+            self._mirrors_updated.add(upstream.full_name)
+        return mirror_path
+
+    def _clone_from_mirror(self, repo, upstream, clone_path, branch=None):
+        """Clone fork repo by copying its upstream's mirror locally, then fetching only
+        what the fork adds from repo.git_url and checking out the fork's branch."""
+        mirror_path = self.update_mirror(upstream)
+        cloned_repo = pygit2.clone_repository(mirror_path, clone_path)
+        cloned_repo.remotes.set_url('origin', repo.git_url)
+        # the upstream commits are already here, so this only transfers the fork's own
+        cloned_repo.remotes['origin'].fetch(prune=pygit2.enums.FetchPrune.PRUNE)
+        branch = branch or cloned_repo.head.shorthand
+        remote_ref = cloned_repo.lookup_reference(f"refs/remotes/origin/{branch}")
+        commit = cloned_repo[remote_ref.target]
+        local_branch = cloned_repo.branches.local.get(branch)
+        if local_branch is None:
+            local_branch = cloned_repo.branches.local.create(branch, commit)
+        cloned_repo.checkout(local_branch)
+        cloned_repo.reset(commit.id, pygit2.enums.ResetMode.HARD)
+        local_branch.upstream = cloned_repo.branches.remote[f"origin/{branch}"]
+        return cloned_repo
+
+    def deepen(self, repos, depth=None, remote='origin'):
+        """fetch more history for shallow clones: the last depth commits, or all of it if depth is None"""
+        repos = self._local_repo_list(repos)
+        for repo in repos:
+            repo = repo.local_repo if isinstance(repo, CloneResult) else repo
+            if not repo or not repo.is_shallow:
+                continue
+            if self.is_test or self.is_verbose:
+                print(f"Deepening {repo.path} to {depth or 'full'} history...")
+            if not self.is_test:
+                with self.tracer.span('fetch', remote=remote, depth=depth):
+                    # libgit2's GIT_FETCH_DEPTH_UNSHALLOW
+                    repo.remotes[remote].fetch(depth=int(depth) if depth else 2147483647)
 
     # adding upstream remote
     # maybe should be able to set name of upstream parent
@@ -329,32 +1904,710 @@ Arguments:
             print(f"Retrieving {p.owner}/{p.repo}")
         return self.g.get_repo(p.owner+"/"+p.repo)
 
+    @staticmethod
+    def full_name_from_url(url):
+        """owner/repo for the url of a github repo, or None if it isn't one"""
+        p = giturlparse.parse(url)
+        if not (p.valid and p.owner and p.repo):
+            return None
+        return f"{p.owner}/{p.repo}"
+
+    @staticmethod
+    def clone_url_from_url(url):
+        """https clone url for the url (git://, ssh or https) of a github repo, or None if it isn't one"""
+        p = giturlparse.parse(url)
+        if not (p.valid and p.owner and p.repo):
+            return None
+        return f"https://{p.resource}/{p.owner}/{p.repo}.git"
+
+    def _github_clone_url(self, url):
+        """clone_url_from_url, but only for a repo on github.com or on the Github at api_url;
+        None for any other remote, whose clone url can't be worked out from its url"""
+        match = re.fullmatch(r'(?:\w[\w+.-]*://)?(?:[^@/]+@)?([^/:]+)(?::\d+)?[:/]([^/:]+)/([^/]+?)(?:\.git)?/?', url)
+        if not match:
+            return None
+        api_host = urlsplit(self.api_url).hostname or ''
+        github_hosts = {'github.com', api_host, api_host[len('api.'):] if api_host.startswith('api.') else api_host}
+        if match.group(1).lower() not in github_hosts:
+            return None
+        return f"https://{match.group(1)}/{match.group(2)}/{match.group(3)}.git"
+
+    def resolve_repos(self, full_names, batch_size=100, workers=1):
+        """Fetch name, clone URLs, fork status and parent for many "owner/repo" names,
+        up to batch_size per GraphQL query, running up to workers queries at once.
+        Returns dict of full_name -> Repository; names Github doesn't know are left out."""
+        full_names = list(dict.fromkeys(name for name in full_names if name))
+        batches = [full_names[start:start + batch_size] for start in range(0, len(full_names), batch_size)]
+        resolved = {}
+        if int(workers) > 1 and len(batches) > 1:
+            with ThreadPoolExecutor(max_workers=int(workers)) as executor:
+                for batch_resolved in executor.map(self._resolve_batch, batches):
+                    resolved.update(batch_resolved)
+        else:
+            for batch in batches:
+                resolved.update(self._resolve_batch(batch))
+        return resolved
+
+    def _resolve_batch(self, batch):
+        """resolve_repos for one GraphQL query's worth of names"""
+        params = ', '.join(f"$o{n}: String!, $n{n}: String!" for n in range(len(batch)))
+        fields = ' '.join(f"r{n}: repository(owner: $o{n}, name: $n{n}) {{ ...repoFields }}"
+                          for n in range(len(batch)))
+        variables = {}
+        for n, full_name in enumerate(batch):
+            variables[f"o{n}"], variables[f"n{n}"] = full_name.split('/', 1)
+        if self.is_test or self.is_verbose:
+            print(f"Retrieving {len(batch)} repo(s)")
+        data = self._graphql(f"query({params}) {{ {fields} }} {REPO_FIELDS}", variables)
+        return {full_name: self._repo_from_graphql(data[f"r{n}"])
+                for n, full_name in enumerate(batch) if data.get(f"r{n}")}
+
+    def _graphql(self, query, variables):
+        """POST a GraphQL query and return its data. Unlike Requester.graphql_query,
+        errors for some of the fields (e.g. a repo that doesn't exist) aren't raised."""
+        from github import GithubException
+        requester = self.g.requester
+        _, response = requester.requestJsonAndCheck("POST", requester.graphql_url,
+                                                    input={'query': query, 'variables': variables})
+        if not response.get('data'):
+            raise GithubException(400, response, None)
+        return response['data']
+
     def add_upstream_repos(self, cloned_repos):
-        """set upstream remotes for local copies of cloned_repos"""
+        """set upstream remotes for local copies of cloned_repos.
+        cloned_repos may be pygit2 repos or the CloneResults returned by clone_repos"""
     # make sure cloned_repos is iterable
-        if not self._is_iterable(cloned_repos): cloned_repos = [cloned_repos]
+        cloned_repos = self._local_repo_list(cloned_repos)
+        journal_keys = {} # clone path -> full_name the journal knows it by
+        if self.journal:
+            for result in cloned_repos:
+                if isinstance(result, CloneResult) and result.local_repo and isinstance(result.repo, ForkHandle):
+                    journal_keys[result.local_repo.path] = result.repo.source.full_name
+        cloned_repos = [repo.local_repo if isinstance(repo, CloneResult) else repo for repo in cloned_repos]
+        cloned_repos = [repo for repo in cloned_repos if repo and not
+                        (repo.path in journal_keys and self.journal.get(journal_keys[repo.path], 'upstream'))]
         upstream_remotes = []
-        msg_prefix = 'TEST: ' if self.is_test else ''
+        # look up every origin in a handful of batched queries
+        origins = {}
         for cloned_repo in cloned_repos:
-            if self.is_test or self.is_verbose:
-                print(f"Getting {cloned_repo.remotes['origin'].url}...")
-            forked_repo = self.get_github_repo_from_url(cloned_repo.remotes["origin"].url)
+            try:
+                origins[cloned_repo.path] = self.full_name_from_url(cloned_repo.remotes["origin"].url)
+            except KeyError:
+                print(f"{cloned_repo.path} does not have an origin remote.")
+        forked_repos = self.resolve_repos(origins.values())
+        for cloned_repo in cloned_repos:
+            forked_repo = forked_repos.get(origins.get(cloned_repo.path))
+            if not forked_repo:
+                if self.is_test or self.is_verbose:
+                    print(f"Origin of {cloned_repo.path} not found on Github.")
+                continue
             if not forked_repo.parent: # skip
                 if self.is_test or self.is_verbose:
-                    print(f"Repo {forked_repo.url} does not have an upstream parent.")
+                    print(f"Repo {forked_repo.full_name} does not have an upstream parent.")
+                continue
+            remote_upstream = self._add_upstream_remote(cloned_repo, forked_repo.parent.git_url)
+            if remote_upstream:
+                upstream_remotes.append(remote_upstream)
+                if cloned_repo.path in journal_keys:
+                    self.journal.record(journal_keys[cloned_repo.path], 'upstream', url=remote_upstream.url)
+        self.upstream_remotes = upstream_remotes
+        return upstream_remotes
+
+    def _add_upstream_remote(self, cloned_repo, upstream_url):
+        """add remote upstream at upstream_url to cloned_repo, unless it already has one.
+        Returns the upstream remote (None in test mode)."""
+        msg_prefix = 'TEST: ' if self.is_test else ''
+        if self.is_test or self.is_verbose:
+            print(f"{msg_prefix}Adding upstream remote {upstream_url}...")
+        if self.is_test:
+            return None
+        try:
+            remote_upstream = cloned_repo.remotes['upstream']
+            if self.is_verbose:
+                print(f"Upstream remote {remote_upstream.url} already exists.")
+        except KeyError:
+            with self.tracer.span('remote', name='upstream', url=upstream_url):
+                remote_upstream = cloned_repo.remotes.create("upstream", upstream_url)
+            self._reindex_remotes(cloned_repo)
+        if self.is_verbose:
+            print(f"Done.")
+        return remote_upstream
+
+    # keeping local clones up to date with their upstreams
+
+    def sync_upstreams(self, repos=None, branch=None, workers=8, force=False):
+        """Fetch the upstream remote of every repo in repos (default: local_repos) on up to
+        workers threads. Repos whose upstream branches all match what was fetched last time
+        (checked with a cheap ls-remote) are skipped, unless force.
+        If branch is given (True for each repo's current branch), fast-forward that local
+        branch to upstream's; branches that have diverged are left alone and reported.
+        Returns a SyncResult for each repo and prints a summary."""
+        if repos is None: repos = self.local_repos
+        repos = self._local_repo_list(repos)
+        with ThreadPoolExecutor(max_workers=int(workers)) as executor:
+            results = list(executor.map(lambda repo: self._sync_upstream(repo, branch, force), repos))
+        counts = Counter(result.status for result in results)
+        print(', '.join(f"{n} {status}" for status, n in sorted(counts.items())) or "No repos to sync.")
+        for result in results:
+            if self.is_verbose or result.status in ('failed', 'diverged'):
+                print(f"{result.status:>15}  {result.name}  {result.detail or ''}")
+        return results
+
+    def _sync_upstream(self, repo, branch=None, force=False):
+        """sync_upstreams for a single repo; exceptions are reported as 'failed'"""
+        name = getattr(repo, 'name', None) or path.basename(path.dirname(repo.path.rstrip('/')))
+        repo_path = getattr(repo, 'workdir_path', None) or repo.workdir
+        try:
+            try:
+                upstream = repo.remotes['upstream']
+            except KeyError:
+                return SyncResult(name, repo_path, 'no upstream', None)
+            with self.tracer.span('ls_remote', url=upstream.url):
+                heads = {head.name: head.oid for head in upstream.list_heads() if head.name.startswith('refs/heads/')}
+            tracking = {f"refs/heads/{ref[len('upstream/'):]}": repo.branches.remote[ref].target
+                        for ref in repo.branches.remote if ref.startswith('upstream/') and ref != 'upstream/HEAD'}
+            status, detail = 'unchanged', None
+            if force or heads != tracking:
+                if self.is_test:
+                    return SyncResult(name, repo_path, 'fetched', 'TEST: not fetched')
+                with self.tracer.span('fetch', remote='upstream', url=upstream.url) as span:
+                    stats = upstream.fetch(prune=pygit2.enums.FetchPrune.PRUNE)
+                    span['received_bytes'] = stats.received_bytes
+                status, detail = 'fetched', f"{stats.received_objects} objects"
+            if branch and not self.is_test:
+                ff_status, ff_detail = self._fast_forward(repo, None if branch is True else branch)
+                if ff_status:
+                    status, detail = ff_status, ff_detail
+            return SyncResult(name, repo_path, status, detail)
+        except Exception as err:
+            return SyncResult(name, repo_path, 'failed', str(err))
+
+    @staticmethod
+    def _fast_forward(repo, branch=None):
+        """fast-forward local branch (default: the current one) to upstream's.
+        Returns (status, detail), or (None, None) if there was nothing to do."""
+        branch = branch or repo.head.shorthand
+        upstream_branch = repo.branches.remote.get(f"upstream/{branch}")
+        local_branch = repo.branches.local.get(branch)
+        if upstream_branch is None or local_branch is None:
+            return None, None
+        target = upstream_branch.target
+        analysis, _ = repo.merge_analysis(target, local_branch.name)
+        if analysis & pygit2.enums.MergeAnalysis.UP_TO_DATE:
+            return None, None
+        if not analysis & pygit2.enums.MergeAnalysis.FASTFORWARD:
+            return 'diverged', f"{branch} has diverged from upstream/{branch}"
+        if local_branch.is_head():
+            repo.checkout_tree(repo.get(target)) # refuses to overwrite local changes
+        local_branch.set_target(target)
+        return 'fast-forwarded', f"{branch} to {str(target)[:7]}"
+
+    def divergence_report(self, repos=None, branch=None, workers=None, cache_file='.divergence_cache'):
+        """How many commits the local branch (default: the current one) of every repo in repos
+        (default: local_repos) is ahead of and behind the same branch of its upstream remote.
+        The commit graphs are walked on up to workers processes, at most one per CPU. The
+        counts are kept in cache_file by the pair of commits compared, which they can't change
+        for, so a rerun only walks repos whose branch or upstream has moved since.
+        Returns a DivergenceResult for each repo."""
+        if repos is None: repos = self.local_repos
+        repos = self._local_repo_list(repos)
+        workers = min(int(workers or os.cpu_count() or 1), os.cpu_count() or 1)
+        cache = self._load_divergence_cache(cache_file)
+        results = [] # DivergenceResult, or (name, path, branch, gitdir, local OID, upstream OID) to count
+        for repo in repos:
+            results.append(self._divergence_refs(repo, branch))
+        to_count = {} # 'local..upstream' -> (gitdir, local, upstream)
+        for result in results:
+            if not isinstance(result, DivergenceResult):
+                _, _, _, gitdir, local, upstream = result
+                key = f"{local}..{upstream}"
+                if key not in cache:
+                    to_count.setdefault(key, (gitdir, local, upstream))
+        if self.is_verbose:
+            print(f"Counting {len(to_count)} of {len(results)} repo(s), the rest are cached or have nothing to count.")
+        if to_count:
+            gitdirs, locals_, upstreams = zip(*to_count.values())
+            with self.tracer.span('ahead_behind', repos=len(to_count)):
+                if workers == 1 or len(to_count) == 1:
+                    counts = map(_ahead_behind, gitdirs, locals_, upstreams)
+                    cache.update(zip(to_count, counts))
+                else:
+                    with ProcessPoolExecutor(max_workers=workers) as executor:
+                        chunksize = max(1, len(to_count) // (4 * workers))
+                        counts = executor.map(_ahead_behind, gitdirs, locals_, upstreams, chunksize=chunksize)
+                        cache.update(zip(to_count, counts))
+        report = []
+        used = {}
+        for result in results:
+            if not isinstance(result, DivergenceResult):
+                name, repo_path, branch_name, _, local, upstream = result
+                key = f"{local}..{upstream}"
+                ahead, behind, error = used[key] = cache[key]
+                if error:
+                    result = DivergenceResult(name, repo_path, branch_name, None, None, 'failed', error)
+                else:
+                    status = ('diverged' if ahead and behind else 'ahead' if ahead else
+                              'behind' if behind else 'up to date')
+                    result = DivergenceResult(name, repo_path, branch_name, ahead, behind, status, None)
+            report.append(result)
+        # only what this run compared is kept, so the cache doesn't grow with every commit
+        self._save_divergence_cache(cache_file, {key: counts for key, counts in used.items() if not counts[2]})
+        return report
+
+    def _divergence_refs(self, repo, branch=None):
+        """the commits divergence_report has to compare for repo, as (name, path, branch, gitdir,
+        local OID, upstream OID); or a DivergenceResult if there's nothing to count"""
+        name = getattr(repo, 'name', None) or path.basename(path.dirname(repo.path.rstrip('/')))
+        repo_path = getattr(repo, 'workdir_path', None) or repo.workdir
+        remotes = getattr(repo, 'indexed_remotes', None)
+        if remotes is not None and 'upstream' not in remotes: # no need to open it
+            return DivergenceResult(name, repo_path, branch, None, None, 'no upstream', None)
+        try:
+            if 'upstream' not in repo.remotes.names():
+                return DivergenceResult(name, repo_path, branch, None, None, 'no upstream', None)
+            if not branch and (repo.head_is_unborn or repo.head_is_detached):
+                return DivergenceResult(name, repo_path, None, None, None, 'failed', 'not on a branch')
+            branch_name = branch or repo.head.shorthand
+            local_branch = repo.branches.local.get(branch_name)
+            upstream_branch = repo.branches.remote.get(f"upstream/{branch_name}")
+            if local_branch is None or upstream_branch is None:
+                missing = branch_name if local_branch is None else f"upstream/{branch_name}"
+                return DivergenceResult(name, repo_path, branch_name, None, None, 'no upstream', f"no {missing}")
+            local, upstream = str(local_branch.target), str(upstream_branch.target)
+            if local == upstream:
+                return DivergenceResult(name, repo_path, branch_name, 0, 0, 'up to date', None)
+            return name, repo_path, branch_name, repo.path, local, upstream
+        except Exception as err:
+            return DivergenceResult(name, repo_path, branch, None, None, 'failed', str(err))
+
+    @staticmethod
+    def _load_divergence_cache(cache_file):
+        """'local..upstream' -> (ahead, behind, None) from cache_file"""
+        if not cache_file or not path.exists(cache_file):
+            return {}
+        try:
+            with open(cache_file) as f:
+                return {key: (ahead, behind, None) for key, (ahead, behind) in json.load(f).items()}
+        except (ValueError, TypeError): # unreadable, so start over
+            return {}
+
+    @staticmethod
+    def _save_divergence_cache(cache_file, cache):
+        if not cache_file:
+            return
+        with open(cache_file, 'w') as f:
+            json.dump({key: [ahead, behind] for key, (ahead, behind, _) in cache.items()}, f)
+
+    # reconciling forks and clones with a manifest
+
+    @classmethod
+    def load_manifest(cls, manifest_file):
+        """the "owner/repo" names listed in a JSON or YAML manifest file, in order and once each.
+        The list can also be under a 'repos' key, and Github urls are taken as well as names."""
+        with open(manifest_file) as f:
+            text = f.read()
+        if manifest_file.endswith(('.yml', '.yaml')):
+            try:
+                import yaml
+            except ImportError:
+                sys.exit(f"Reading {manifest_file} needs PyYAML: pip install pyyaml")
+            manifest = yaml.safe_load(text)
+        else:
+            manifest = json.loads(text)
+        if isinstance(manifest, dict):
+            manifest = manifest.get('repos')
+        if not isinstance(manifest, list):
+            sys.exit(f"{manifest_file} should be a list of owner/repo names")
+        full_names = []
+        for entry in manifest:
+            full_name = cls.full_name_from_url(entry) if '://' in entry or '@' in entry else entry.strip('/')
+            if not full_name or full_name.count('/') != 1:
+                sys.exit(f"{entry} in {manifest_file} isn't an owner/repo name")
+            full_names.append(full_name)
+        return list(dict.fromkeys(full_names))
+
+    @staticmethod
+    def _url_full_name(url):
+        """lowercased owner/repo at the end of a remote url of any protocol (including a local
+        mirror at .../owner/repo.git), or None"""
+        parts = re.sub(r'(\.git)?/*$', '', url or '').replace(':', '/').lower().split('/')
+        return '/'.join(parts[-2:]) if len(parts) > 2 and all(parts[-2:]) else None
+
+    def reconcile_plan(self, full_names):
+        """The steps that would bring full_names ("owner/repo" upstreams) to the desired state:
+        each forked into the user's account, cloned under clone_dir, with origin set to the fork
+        and upstream to the repo. A clone whose upstream remote is the repo and whose origin is
+        one of the user's repos is taken as done from the local index alone, so if everything is
+        done the only request is for the user's login. The user's forks are listed (100 a page)
+        only if something isn't, and repos not forked yet are looked up in batches.
+        A local repo that only shares the repo's name is only taken for its clone if it has no
+        remotes, or one of them is the fork or the repo; otherwise the repo is a 'conflict'.
+        Returns a list of ReconcileStep, a repo's steps in the order they have to be done."""
+        login = self.g.get_user().login.lower()
+        by_upstream, by_origin = {}, {}
+        for repo in self.local_repos:
+            remotes = repo.indexed_remotes
+            by_upstream.setdefault(self._url_full_name(remotes.get('upstream')), repo)
+            by_origin.setdefault(self._url_full_name(remotes.get('origin')), repo)
+        unsettled = []
+        for full_name in full_names:
+            repo = by_upstream.get(full_name.lower())
+            origin = repo.indexed_remotes.get('origin') if repo else None
+            origin_full_name = self._url_full_name(origin)
+            if not (origin_full_name and origin_full_name.split('/')[0] == login and not origin.startswith('git://')):
+                unsettled.append(full_name)
+        if self.is_verbose:
+            print(f"{len(full_names) - len(unsettled)} of {len(full_names)} repo(s) already set up.")
+        if not unsettled:
+            return []
+        forks = {parent.lower(): fork for parent, fork in self.fork_index().items()}
+        upstreams = self.resolve_repos([name for name in unsettled if name.lower() not in forks])
+        steps = []
+        for full_name in unsettled:
+            fork = forks.get(full_name.lower())
+            upstream = fork.parent if fork else upstreams.get(full_name)
+            if not upstream:
+                steps.append(ReconcileStep('missing', full_name, None, 'not found on Github'))
+                continue
+            local = (by_upstream.get(full_name.lower()) or (fork and by_origin.get(fork.full_name.lower()))
+                     or by_origin.get(full_name.lower()))
+            if not local:
+                local = self.local_repos.get(fork.name if fork else upstream.name)
+                ours = {full_name.lower(), fork.full_name.lower() if fork else None}
+                if local and local.indexed_remotes and \
+                        not any(self._url_full_name(url) in ours for url in local.indexed_remotes.values()):
+                    steps.append(ReconcileStep('conflict', full_name, local,
+                                               f"{local.workdir_path} is a clone of another repo"))
                     continue
+            if not fork:
+                steps.append(ReconcileStep('fork', full_name, upstream, None))
+            if not local:
+                name = fork.name if fork else upstream.name
+                steps.append(ReconcileStep('clone', full_name, fork, path.join(self.clone_dir, name)))
+                steps.append(ReconcileStep('add upstream', full_name, None, upstream.git_url))
+                continue
+            origin = local.indexed_remotes.get('origin')
+            if not fork or self._url_full_name(origin) != fork.full_name.lower() or origin.startswith('git://'):
+                # a new fork's url is only known once it's made
+                steps.append(ReconcileStep('set origin', full_name, local, fork.clone_url if fork else None))
+            upstream_url = local.indexed_remotes.get('upstream')
+            if upstream_url is None:
+                steps.append(ReconcileStep('add upstream', full_name, local, upstream.git_url))
+            elif self._url_full_name(upstream_url) != full_name.lower():
+                steps.append(ReconcileStep('set upstream', full_name, local, upstream.git_url))
+        return steps
 
+    def reconcile(self, full_names, workers=4, fork_timeout=120, **clone_options):
+        """Print the reconcile_plan for full_names and, unless in test mode, carry it out:
+        repos on up to workers threads at once, each one's steps in turn.
+        clone_options are passed on to clone_repos.
+        Returns a dict of full_name -> the error that stopped its steps."""
+        steps = self.reconcile_plan(full_names)
+        for step in steps:
+            detail = step.detail or ('the new fork' if step.action == 'set origin' else '')
+            print(f"{'TEST: ' if self.is_test else ''}{step.action:<12} {step.full_name}  {detail}")
+        if not steps:
+            print("Nothing to do.")
+        plan = OrderedDict() # full_name -> its steps
+        for step in steps:
+            if step.action not in ('missing', 'conflict'):
+                plan.setdefault(step.full_name, []).append(step)
+        if self.is_test or not plan:
+            return {}
+        working_dir = self.config['--dir']
+        failed = {}
+        with ThreadPoolExecutor(max_workers=int(workers)) as executor:
+            futures = {executor.submit(self._reconcile_repo, repo_steps, working_dir, fork_timeout, clone_options):
+                       full_name for full_name, repo_steps in plan.items()}
+            for future in futures:
+                error = future.result()
+                if error:
+                    failed[futures[future]] = error
+        if self._local_index is not None:
+            self._local_index.save()
+        print(f"{len(plan) - len(failed)} repo(s) reconciled" + (f", {len(failed)} failed." if failed else "."))
+        return failed
+
+    def _reconcile_repo(self, steps, working_dir, fork_timeout, clone_options):
+        """carry out one repo's reconcile steps; returns the error that stopped them, or None"""
+        fork = local = None
+        for step in steps:
+            try:
+                if step.action == 'fork':
+                    fork = self._fork_repo(step.target, include_old=True)
+                    if not self._wait_for_fork(fork, fork_timeout):
+                        raise RuntimeError(f"fork not ready after {fork_timeout} seconds")
+                elif step.action == 'clone':
+                    result = self._clone_repo(fork or step.target, working_dir, **clone_options)
+                    if result.error:
+                        raise result.error
+                    if not result.local_repo:
+                        raise RuntimeError(f"{step.detail} wasn't cloned ({result.status})")
+                    local = result.local_repo
+                elif step.action == 'set origin':
+                    if 'origin' in step.target.remotes.names():
+                        self._set_remote_url(step.target, 'origin', step.detail or fork.clone_url)
+                    else:
+                        with self.tracer.span('remote', name='origin', url=step.detail or fork.clone_url):
+                            step.target.remotes.create('origin', step.detail or fork.clone_url)
+                        self._reindex_remotes(step.target)
+                elif step.action == 'add upstream':
+                    self._add_upstream_remote(step.target or local, step.detail)
+                elif step.action == 'set upstream':
+                    self._set_remote_url(step.target, 'upstream', step.detail)
+            except Exception as err:
+                print(f"{step.full_name} failed at {step.action}: {err}")
+                return err
+        return None
+
+    # streaming search -> fork -> clone -> upstream
+
+    def pipeline(self, keywords, user=None, max_match=None, fork=True, clone=True, upstream=True,
+                 include_old=False, workers=4, queue_size=16, fork_timeout=120, shard_by=None, repos=None,
+                 **clone_options):
+        """Generator: stream search results through the fork, clone and upstream stages.
+        Each stage runs on its own pool of workers with bounded queues in between, so
+        a repo is cloned as soon as its fork is ready while later repos are still being
+        found and forked, and memory stays flat however many repos match. The fork
+        workers only ask for forks; one poller waits on all the forks Github is still
+        copying, so forks aren't held up by the ones before them.
+        Without fork, clone and upstream use the user's existing forks.
+        shard_by is passed on to iter_github_repos. Given repos, those are used instead of
+        searching for keywords.
+        clone_options are passed on to clone_repos.
+        Yields a PipelineItem for each repo once it has gone as far as it can."""
+        working_dir = self.config['--dir']
+        if (clone or upstream) and self.dir_is_repo(working_dir):
+            sys.exit(f"A repository already exists in {working_dir}")
+        stages = [] # (start function, stage)
+        if fork or clone or upstream:
+            stages.append((self._start_stage, lambda item: self._fork_stage(item, fork, include_old)))
+            stages.append((self._start_fork_poller, fork_timeout))
+        if clone or upstream:
+            stages.append((self._start_stage, lambda item: self._clone_stage(item, working_dir, clone, clone_options)))
+        if upstream:
+            stages.append((self._start_stage, self._upstream_stage))
+
+        results = queue.Queue(maxsize=queue_size)
+        found = inbox = queue.Queue(maxsize=queue_size) if stages else results
+        for n, (start, stage) in enumerate(stages):
+            outbox = results if n == len(stages) - 1 else queue.Queue(maxsize=queue_size)
+            start(stage, inbox, outbox, results, int(workers))
+            inbox = outbox
+
+        search_errors = []
+        def search():
+            try:
+                if repos is None:
+                    found_repos = self.iter_github_repos(keywords, user, max_match, shard_by, workers)
+                else:
+                    found_repos = itertools.islice(repos, int(max_match) if max_match else None)
+                for repo in found_repos:
+                    found.put(PipelineItem(repo))
+            except Exception as err:
+                search_errors.append(err)
+            finally:
+                found.put(PIPELINE_DONE)
+        threading.Thread(target=search, daemon=True).start()
+
+        try:
+            while True:
+                item = results.get()
+                if item is PIPELINE_DONE:
+                    break
+                yield item
+        finally:
+            if self._local_index is not None:
+                self._local_index.save()
+        if search_errors:
+            raise search_errors[0]
+
+    # watching for new repos
+
+    def watch(self, keywords, user=None, interval=60, max_interval=900, polls=None,
+              state_file='.watch_state', shard_by=None, **pipeline_options):
+        """Generator: keep searching for keywords, and put only the repos that are new since
+        the last poll through pipeline(**pipeline_options), yielding their PipelineItems.
+        The first poll is a full search. After that only repos created since the newest one
+        seen (the high-water mark, kept in state_file so a restarted watch carries on) are
+        asked for, and the query stays the same until something new turns up; with the
+        response cache (which watch turns on unless a cache_dir, or None, was given) a quiet
+        poll is a 304 that costs no rate limit.
+        Polls are interval seconds apart at first, half as far apart again after each quiet
+        poll up to max_interval, and back to interval once something is found.
+        Stops after polls polls (default: never)."""
+        if self._g is None and not self._cache_dir_given:
+            self.cache_dir = DEFAULT_CACHE_DIR
+        query = self._search_query(keywords, user)
+        state = self._load_watch_state(state_file, query)
+        wait = float(interval)
+        for poll in itertools.count():
+            if polls is not None and poll >= int(polls):
+                return
+            if poll:
+                time.sleep(wait)
+            new_repos = self._poll_new_repos(query, state, shard_by)
             if self.is_test or self.is_verbose:
-                print(f"{msg_prefix}Adding upstream remote {forked_repo.parent.git_url}...")
-            if not self.is_test:
+                print(f"{len(new_repos)} new repo(s) matching {query}")
+            if new_repos:
+                yield from self.pipeline(None, repos=new_repos, **pipeline_options)
+                wait = float(interval)
+            else:
+                wait = min(wait * 1.5, float(max_interval))
+            # only once they've been through the pipeline, so a watch that is stopped redoes them
+            self._save_watch_state(state_file, state)
+
+    def _poll_new_repos(self, query, state, shard_by=None):
+        """the repos matching query created since state's high-water mark that haven't been seen;
+        moves the mark up to the newest of them"""
+        mark = state['mark']
+        if mark:
+            pages = self._search_pages(f"{query} created:>={mark}")
+            repos = itertools.chain.from_iterable(page for _, page in pages)
+        elif shard_by:
+            repos = self.iter_sharded_search(query, shard_by)
+        else:
+            repos = itertools.chain.from_iterable(page for _, page in self._search_pages(query))
+        # created:>= takes in the repos made in the mark's second again, so those are remembered
+        new_repos = [repo for repo in repos if repo.full_name not in state['seen']]
+        for repo in new_repos:
+            if repo.created_at and (not state['mark'] or repo.created_at > state['mark']):
+                state['mark'], state['seen'] = repo.created_at, set()
+        state['seen'].update(repo.full_name for repo in new_repos if repo.created_at == state['mark'])
+        return new_repos
+
+    @staticmethod
+    def _load_watch_state(state_file, query):
+        """high-water mark and repos seen at it from state_file, if they're for query"""
+        state = {'query': query, 'mark': None, 'seen': set()}
+        if state_file and path.exists(state_file):
+            try:
+                with open(state_file) as f:
+                    saved = json.load(f)
+            except ValueError:
+                return state
+            if saved.get('query') == query:
+                state.update(mark=saved.get('mark'), seen=set(saved.get('seen') or ()))
+        return state
+
+    @staticmethod
+    def _save_watch_state(state_file, state):
+        if not state_file:
+            return
+        with open(state_file, 'w') as f:
+            json.dump(dict(state, seen=sorted(state['seen'])), f)
+
+    @staticmethod
+    def _start_stage(stage, inbox, outbox, results, workers):
+        """Run stage on the items from inbox in workers threads. Items for which stage
+        returns True go on to outbox; the rest (and any that raise) go to results."""
+        running = [workers]
+        lock = threading.Lock()
+        def work():
+            while True:
+                item = inbox.get()
+                if item is PIPELINE_DONE:
+                    inbox.put(PIPELINE_DONE) # for the other workers
+                    with lock:
+                        running[0] -= 1
+                        if running[0] == 0:
+                            outbox.put(PIPELINE_DONE)
+                    return
                 try:
-                    remote_upstream = cloned_repo.remotes['upstream']
-                    if self.is_test or self.is_verbose:
-                        print(f"Upstream remote {remote_upstream.url} already exists.")
-                    upstream_remotes.append(remote_upstream)
-                except:
-                    upstream_remotes.append(cloned_repo.remotes.create("upstream", forked_repo.parent.git_url))
-            if self.is_verbose:
-                print(f"Done.")
-        self.upstream_remotes = upstream_remotes
-        return upstream_remotes
+                    passed = stage(item)
+                except Exception as err:
+                    item.error = err
+                    passed = False
+                (outbox if passed else results).put(item)
+        for _ in range(workers):
+            threading.Thread(target=work, daemon=True).start()
+
+    def _start_fork_poller(self, timeout, inbox, outbox, results, workers):
+        """Poll the forks of the items from inbox together (workers polls at a time), passing
+        each item on to outbox as soon as its fork is ready, or to results if it isn't after
+        timeout seconds."""
+        events = queue.Queue()
+        items = {} # id of a ForkHandle -> its item
+        def feed():
+            while True:
+                item = inbox.get()
+                if item is PIPELINE_DONE:
+                    events.put(('closed', None))
+                    return
+                items[id(item.fork)] = item
+                events.put(('add', item.fork))
+        def poll():
+            for handle, ready in self._poll_forks(events, timeout, workers):
+                item = items.pop(id(handle))
+                if isinstance(ready, Exception):
+                    item.error = ready
+                (outbox if ready is True else results).put(item)
+            outbox.put(PIPELINE_DONE)
+        threading.Thread(target=feed, daemon=True).start()
+        threading.Thread(target=poll, daemon=True).start()
+
+    def _fork_stage(self, item, fork, include_old):
+        item.stage = 'fork'
+        item.fork = self._fork_repo(item.repo, include_old, create=fork)
+        return bool(item.fork)
+
+    def _clone_stage(self, item, working_dir, clone, clone_options):
+        item.stage = 'clone'
+        item.clone = self._clone_repo(item.fork, working_dir, clone, **clone_options)
+        if item.clone.error:
+            item.error = item.clone.error
+        return item.clone.local_repo is not None
+
+    def _upstream_stage(self, item):
+        item.stage = 'upstream'
+        if self.journal and self.journal.get(item.repo.full_name, 'upstream'):
+            return True
+        # the fork's parent is the repo we searched for, so no API call is needed
+        item.upstream = self._add_upstream_remote(item.clone.local_repo, item.repo.git_url)
+        if self.journal and item.upstream:
+            self.journal.record(item.repo.full_name, 'upstream', url=item.upstream.url)
+        return True
+
+    # resuming jobs from a JobJournal
+
+    def _journal_found(self, repo):
+        if self.journal and not self.journal.get(repo.full_name, 'found'):
+            self.journal.record(repo.full_name, 'found', repo=self._journal_fields(repo))
+
+    def _journal_fork(self, handle):
+        """record handle's fork in the journal; returns handle"""
+        if self.journal:
+            self.journal.record(handle.source.full_name, 'forked',
+                                fork=self._journal_fields(handle.repo), created=handle.created, ready=handle.ready)
+        return handle
+
+    def _resumed_repos(self, max_match=None):
+        """the repos a journaled search found, without asking Github"""
+        found = self.journal.found()
+        if max_match:
+            found = found[:int(max_match)]
+        return [RepoRecord.from_raw(data['repo']) for data in found]
+
+    def _resumed_fork(self, repo):
+        """ForkHandle for the journaled fork of repo, or None"""
+        forked = self.journal.get(repo.full_name, 'forked') if self.journal else None
+        if not forked:
+            return None
+        handle = ForkHandle(self._repo_from_raw(forked['fork']), repo, created=forked['created'])
+        if forked.get('ready') or self.journal.get(repo.full_name, 'cloned'):
+            handle.ready = True
+        return handle
+
+    @classmethod
+    def _journal_fields(cls, repo):
+        """the fields of repo that cloning and adding upstreams use, read without completing it
+        from Github, for a JobJournal"""
+        if isinstance(repo, RepoRecord):
+            return repo.raw()
+        raw = getattr(repo, '_rawData', None) or repo.raw_data
+        fields = {key: raw[key] for key in JOURNAL_FIELDS if key in raw}
+        if raw.get('owner'):
+            fields['owner'] = {'login': raw['owner']['login']}
+        if raw.get('parent'):
+            fields['parent'] = cls._journal_fields(repo.parent)
+        return fields
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+"""Usage:
+  githubtools search [options] KEYWORD ...
+  githubtools fork [options] KEYWORD ...
+  githubtools clone [options] [--fork --upstream --wait=<sec>]
+                    [--depth=<n> --single-branch --filter=<spec> --mirror-dir=<dir>] KEYWORD ...
+  githubtools watch [options] [--fork --clone --upstream --wait=<sec>]
+                    [--interval=<sec> --max-interval=<sec> --watch-state=<file>]
+                    [--depth=<n> --single-branch --filter=<spec> --mirror-dir=<dir>] KEYWORD ...
+  githubtools reconcile [options] [--wait=<sec> --depth=<n> --single-branch --filter=<spec>]
+                        [--mirror-dir=<dir>] MANIFEST
+  githubtools upstream [options] DIR
+  githubtools fixorigin [options] [--verify] DIR
+  githubtools sync [options] [--force --branch=<branch> --current] DIR
+  githubtools divergence [options] [--branch=<branch> --format=<fmt> --divergence-cache=<file>] DIR
+  githubtools (-h|--help)
+
+Search Github for repositories matching KEYWORDs, fork them to the user's Github account,
+clone the forks and add upstream remotes, or look after the gits found under DIR.
+
+Commands:
+  search      list matching repositories
+  fork        fork matching repositories
+  clone       clone the user's forks of matching repositories (with --fork, fork them first;
+              with --upstream, also add the upstream remote)
+  watch       keep searching, and list (or fork, clone and add the upstream remote of) only
+              the repos that are new since the last poll
+  reconcile   fork, clone and set the remotes of the repos listed in MANIFEST, doing only what
+              isn't done yet (with --test, only print what would be done)
+  upstream    add an upstream remote to every fork found under DIR that hasn't got one
+  fixorigin   make sure the origin of every git found under DIR is set to its clone_url
+  sync        fetch the upstream of every git found under DIR
+  divergence  show how far ahead of and behind upstream every git found under DIR is
+
+Arguments:
+  KEYWORD               keywords to search Github repositories for
+  DIR                   root directory to search for gits
+  MANIFEST              JSON or YAML file listing owner/repo names of upstream repositories
+
+Options:
+  -h --help             show this screen.
+  -v --verbose          verbose mode
+  --test                test mode (no write)
+  -n <max>              specify <max> limit of matching repositories
+  --shard-by=<date>     split the search into ranges of created or pushed <date>, to find
+                        more than the 1,000 repos Github gives for one search
+  --user=<username>     specify user for search (optional)
+  --dir=<dir>           specify parent <dir> in which to clone repositories [default: .]
+  --locals=<list>       specify file name of the index of local repos [default: git_list]
+  --ignore=<globs>      comma-separated globs of directories not to look for gits in,
+                        besides node_modules, virtualenvs and caches
+  --max-depth=<n>       only look for gits up to <n> directories below DIR (or --dir)
+  --jobs=<n>            work on up to <n> repositories at once [default: 4]
+  --wait=<sec>          give up on forks Github hasn't finished after <sec> seconds [default: 120]
+  --depth=<n>           only clone the last <n> commits of history
+  --single-branch       only clone the default branch
+  --filter=<spec>       partial clone, e.g. --filter=blob:none (needs git installed)
+  --mirror-dir=<dir>    clone forks from local bare mirrors of their upstreams kept in <dir>
+  --interval=<sec>      poll every <sec> seconds at first [default: 60]
+  --max-interval=<sec>  poll less and less often while nothing turns up, down to every <sec>
+                        seconds [default: 900]
+  --watch-state=<file>  remember the newest repo seen in <file> [default: .watch_state]
+  --verify              look every origin up on Github, to catch renamed or transferred repos
+  --force               fetch even if upstream looks unchanged
+  --branch=<branch>     fast-forward local <branch> to upstream/<branch>; with divergence,
+                        compare <branch> instead of each repo's current branch
+  --current             fast-forward each repo's current branch to upstream's
+  --format=<fmt>        print the divergence report as a table, csv or json [default: table]
+  --divergence-cache=<file>
+                        keep ahead/behind counts in <file> [default: .divergence_cache]
+  -t ACCESS_TOKEN       specify ACCESS_TOKEN directly, takes precedence over ACCESS_TOKEN_FILE;
+                        separate several tokens with commas to pool them
+  -f ACCESS_TOKEN_FILE  specify file in working directory with ACCESS_TOKEN, one per line [default: .oAuth]
+  --api-url=<url>       Github API URL, e.g. of Github Enterprise (default: https://api.github.com)
+  --cache-dir=<dir>     keep Github API responses in <dir> [default: ~/.cache/githubtools]
+  --no-cache            don't use the API response cache
+  --trace=<file>        append a JSON line for every API call, clone, remote edit and
+                        directory walk to <file>
+  --stats               print counts and timings of those when done
+"""
+# githubtools (and with it PyGithub, pygit2 and requests) is only imported once the
+# arguments have been parsed, so --help and argument errors come back straight away
+import csv
+import sys
+import json
+from docopt import docopt
+
+
+def make_githubtool(arguments, clone_dir=None):
+    """Githubtool for the common options. Neither the Github client nor the local index
+    is set up until the command uses it."""
+    from githubtools import Githubtool, Tracer
+    tracer = Tracer(arguments['--trace']) if arguments['--trace'] or arguments['--stats'] else None
+    return Githubtool(arguments['--verbose'],
+                      arguments['--test'],
+                      locals_file=arguments['--locals'],
+                      clone_dir=clone_dir or arguments['--dir'],
+                      access_token_file=arguments['-f'],
+                      access_token=arguments['-t'],
+                      cache_dir=None if arguments['--no-cache'] else arguments['--cache-dir'],
+                      base_url=arguments['--api-url'],
+                      mirror_dir=arguments['--mirror-dir'],
+                      tracer=tracer,
+                      ignore=arguments['--ignore'].split(',') if arguments['--ignore'] else (),
+                      max_depth=arguments['--max-depth'])
+
+
+def search(ght, arguments):
+    for repo in ght.iter_github_repos(arguments['KEYWORD'], arguments['--user'], arguments['-n'],
+                                      arguments['--shard-by'], arguments['--jobs']):
+        print(f"{repo.full_name}\t{repo.clone_url}")
+
+
+def fork(ght, arguments):
+    return run_pipeline(ght, arguments, fork=True, clone=False, upstream=False)
+
+
+def clone(ght, arguments):
+    return run_pipeline(ght, arguments, fork=arguments['--fork'], clone=True, upstream=arguments['--upstream'],
+                        depth=arguments['--depth'],
+                        single_branch=arguments['--single-branch'],
+                        blob_filter=arguments['--filter'])
+
+
+def run_pipeline(ght, arguments, fork, clone, upstream, **clone_options):
+    failed = 0
+    # forks made before are cloned too: that's what clone is for
+    for item in ght.pipeline(arguments['KEYWORD'], arguments['--user'], arguments['-n'],
+                             fork=fork, clone=clone, upstream=upstream, include_old=True,
+                             workers=arguments['--jobs'],
+                             fork_timeout=arguments['--wait'],
+                             shard_by=arguments['--shard-by'],
+                             **clone_options):
+        if item.error:
+            failed += 1
+            print(f"{item.repo.full_name} failed at {item.stage}: {item.error}")
+    return 1 if failed else 0
+
+
+def watch(ght, arguments):
+    stages = arguments['--fork'] or arguments['--clone'] or arguments['--upstream']
+    try:
+        for item in ght.watch(arguments['KEYWORD'], arguments['--user'],
+                              interval=arguments['--interval'],
+                              max_interval=arguments['--max-interval'],
+                              state_file=arguments['--watch-state'],
+                              shard_by=arguments['--shard-by'],
+                              fork=arguments['--fork'], clone=arguments['--clone'], upstream=arguments['--upstream'],
+                              include_old=True,
+                              workers=arguments['--jobs'],
+                              fork_timeout=arguments['--wait'],
+                              depth=arguments['--depth'],
+                              single_branch=arguments['--single-branch'],
+                              blob_filter=arguments['--filter']):
+            if item.error:
+                print(f"{item.repo.full_name} failed at {item.stage}: {item.error}")
+            elif not stages:
+                print(f"{item.repo.full_name}\t{item.repo.clone_url}")
+    except KeyboardInterrupt:
+        pass
+
+
+def reconcile(ght, arguments):
+    failed = ght.reconcile(ght.load_manifest(arguments['MANIFEST']),
+                           workers=arguments['--jobs'],
+                           fork_timeout=arguments['--wait'],
+                           depth=arguments['--depth'],
+                           single_branch=arguments['--single-branch'],
+                           blob_filter=arguments['--filter'])
+    return 1 if failed else 0
+
+
+def upstream(ght, arguments):
+    repos = [repo for repo in ght.local_repos if 'upstream' not in (repo.indexed_remotes or {})]
+    ght.add_upstream_repos(repos)
+
+
+def fixorigin(ght, arguments):
+    ght.set_origins(ght.local_repos, offline=not arguments['--verify'], workers=arguments['--jobs'])
+
+
+def sync(ght, arguments):
+    results = ght.sync_upstreams(branch=arguments['--branch'] or arguments['--current'],
+                                 workers=arguments['--jobs'],
+                                 force=arguments['--force'])
+    return 1 if any(result.status == 'failed' for result in results) else 0
+
+
+def divergence(ght, arguments):
+    report = ght.divergence_report(branch=arguments['--branch'],
+                                   workers=arguments['--jobs'],
+                                   cache_file=arguments['--divergence-cache'])
+    print_divergence(report, arguments['--format'])
+    return 1 if any(result.status == 'failed' for result in report) else 0
+
+
+def print_divergence(report, fmt='table'):
+    if fmt == 'json':
+        print(json.dumps([result._asdict() for result in report], indent=1))
+    elif fmt == 'csv':
+        writer = csv.writer(sys.stdout)
+        writer.writerow(report[0]._fields if report else [])
+        writer.writerows(report)
+    else:
+        print(f"{'status':<12} {'ahead':>6} {'behind':>6}  {'branch':<16} name")
+        for result in sorted(report, key=lambda result: (result.status, result.name)):
+            ahead = '' if result.ahead is None else result.ahead
+            behind = '' if result.behind is None else result.behind
+            print(f"{result.status:<12} {ahead:>6} {behind:>6}  {result.branch or '':<16} {result.name}"
+                  + (f"  ({result.detail})" if result.detail else ''))
+
+
+COMMANDS = {'search': search, 'fork': fork, 'clone': clone, 'watch': watch,
+            'reconcile': reconcile, 'upstream': upstream,
+            'fixorigin': fixorigin, 'sync': sync, 'divergence': divergence}
+
+
+def main(argv=None):
+    arguments = docopt(__doc__, argv)
+    if arguments['--test'] or arguments['--verbose']:
+        print(arguments)
+    command = next(command for name, command in COMMANDS.items() if arguments[name])
+    ght = make_githubtool(arguments, arguments['DIR'])
+    try:
+        status = command(ght, arguments)
+    finally:
+        if ght.tracer.enabled:
+            if arguments['--stats']:
+                print(ght.tracer.summary())
+            ght.tracer.close()
+    return status or 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
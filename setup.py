@@ -7,14 +7,17 @@ import githubtools
 setuptools.setup(
      name='githubtools',
      version='0.13',
-     scripts=['forker.py', 'fixorigin.py', 'forkone.py'] ,
+     scripts=['forker.py', 'fixorigin.py', 'forkone.py', 'syncupstreams.py'] ,
      author="Brad Johnson",
      author_email="climatebrad@gmail.com",
      description="A Github search and cloning utility package",
      long_description=long_description,
      long_description_content_type="text/markdown",
      url="https://github.com/climatebrad/githubtools",
-     py_modules=["githubtools"],
+     py_modules=["githubtools", "githubtools_cli"],
+     entry_points={
+         "console_scripts": ["githubtools=githubtools_cli:main"],
+     },
      classifiers=[
          "Programming Language :: Python :: 3",
          "License :: OSI Approved :: GNU General Public License (GPL)",
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""Usage:
+  syncupstreams.py [(-v|--verbose) --test --force --jobs=<n> --branch=<branch> --current]
+                   [(-t ACCESS_TOKEN|-f ACCESS_TOKEN_FILE) --locals=<list> --trace=<file> --stats]
+                   [--ignore=<globs> --max-depth=<n>] DIR
+  syncupstreams.py (-h|--help)
+
+For every git found under DIR with an upstream remote, fetch upstream, several repos at once.
+Repos whose upstream hasn't changed since the last fetch are skipped after a cheap ls-remote.
+Optionally fast-forward a local branch to upstream's; diverged branches are only reported.
+
+Arguments:
+  DIR            root directory to search for gits
+
+Options:
+  -h --help             show this screen.
+  -v --verbose          verbose mode
+  --test                test mode (check upstreams, but don't fetch)
+  --force               fetch even if upstream looks unchanged
+  --jobs=<n>            sync up to <n> repositories at once [default: 8]
+  --branch=<branch>     fast-forward local <branch> to upstream/<branch>
+  --current             fast-forward each repo's current branch to upstream's
+  --locals=<list>       specify file name of the index of local repos [default: git_list]
+  --ignore=<globs>      comma-separated globs of directories not to look for gits in,
+                        besides node_modules, virtualenvs and caches
+  --max-depth=<n>       only look for gits up to <n> directories below DIR
+  -t ACCESS_TOKEN       specify ACCESS_TOKEN directly, takes precedence over ACCESS_TOKEN_FILE
+  -f ACCESS_TOKEN_FILE  specify file in working directory with ACCESS_TOKEN, one per line [default: .oAuth]
+  --trace=<file>        append a JSON line for every ls-remote, fetch and
+                        directory walk to <file>
+  --stats               print counts and timings of those when done
+"""
+from docopt import docopt
+
+if __name__ == '__main__':
+	config = docopt(__doc__)
+	rootDir = config['DIR']
+	TEST = config['--test']
+	VERBOSE = config['--verbose']
+	if TEST or VERBOSE:
+		print(config)
+
+from githubtools import Githubtool, Tracer
+
+tracer = Tracer(config['--trace']) if config['--trace'] or config['--stats'] else None
+
+ght = Githubtool(VERBOSE,
+                 TEST,
+                 locals_file=config['--locals'],
+                 clone_dir=rootDir,
+                 access_token_file=config['-f'],
+                 access_token=config['-t'],
+                 tracer=tracer,
+                 ignore=config['--ignore'].split(',') if config['--ignore'] else (),
+                 max_depth=config['--max-depth'])
+
+# no Github API calls: everything goes straight to the upstream remotes
+ght.sync_upstreams(branch=config['--branch'] or config['--current'],
+                   workers=config['--jobs'],
+                   force=config['--force'])
+
+if tracer:
+	if config['--stats']:
+		print(tracer.summary())
+	tracer.close()